@@ -0,0 +1,7 @@
+"""
+Benchmarks for the PDF generation paths. Run from the repository root, e.g.
+
+    python -m benchmarks.output_modes
+    python -m benchmarks.api --output run.json --baseline last.json
+    python -m benchmarks.load --concurrency 1,2,4,8,16 --workers 2
+"""
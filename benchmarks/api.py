@@ -0,0 +1,212 @@
+"""
+End-to-end API benchmarks against the real app on SQLite.
+
+For each synthetic template (1-200 pages, 10-2000 fields of mixed text,
+checkbox and choice types) times the upload, the field listing, mapping saves
+and generate-pdf (cold and warm, plus peak Python memory of one fill). Then
+times entity listing at 1k and 100k rows. Prints JSON; with --baseline, exits
+with status 1 if any timing or memory figure regressed past the tolerance.
+
+Usage: python -m benchmarks.api [--repeat 10] [--quick] [--output run.json]
+                                [--baseline old.json --tolerance 0.25]
+"""
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import statistics
+import tracemalloc
+import pypdf
+from tax_form_app.models import ENTITY_FIELDS
+from tax_form_app.template_cache import template_cache
+from tax_form_app.fill_plan import fill_plans
+from .app import bench_app, seed_entities
+from .synthetic import make_template, FIELD_TYPES
+
+# (pages, fields, content bytes per page)
+TEMPLATE_SIZES = [
+    (1, 10, 2000),
+    (10, 100, 2000),
+    (50, 500, 5000),
+    (200, 2000, 5000),
+]
+ENTITY_COUNTS = [1000, 100000]
+# The legacy unpaged listing serializes every row; skip it above this size
+LEGACY_LISTING_MAX_ROWS = 10000
+
+# Metrics compared against a baseline: timings and memory, where lower is better
+COMPARED_SUFFIXES = ('_ms', '_bytes_peak')
+
+
+def _timings(call, repeat):
+    """Runs `call` `repeat` times; returns median and p95 in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+def _check(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f"{response.request.method} {response.request.path} returned "
+                           f"{response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def run_template_case(client, entity_id, pages, fields, content_bytes, mapped, repeat):
+    """Times the form endpoints for one template size."""
+    template, names = make_template(pages, fields, content_bytes, FIELD_TYPES)
+    result = {'pages': pages, 'fields': fields, 'template_bytes': len(template)}
+    counter = iter(range(10 ** 6))
+
+    def upload():
+        return _check(client.post('/api/forms/upload', data={
+            'form_name': f"bench_{pages}_{fields}_{next(counter)}",
+            'file': (io.BytesIO(template), 'bench.pdf'),
+        }), 201)
+
+    result['upload'] = _timings(upload, max(1, repeat // 2))
+    form_id = upload().json['id']
+    result['form_fields'] = _timings(lambda: _check(client.get(f'/api/forms/{form_id}/fields')), repeat)
+
+    # Alternate two mapping sets so every save has a diff to write
+    mapped_names = names[:mapped]
+    mapping_sets = [
+        {name: ENTITY_FIELDS[i % len(ENTITY_FIELDS)] for i, name in enumerate(mapped_names)},
+        {name: ENTITY_FIELDS[(i + 1) % len(ENTITY_FIELDS)] for i, name in enumerate(mapped_names)},
+    ]
+    saves = iter(range(10 ** 6))
+    result['mappings_save'] = _timings(lambda: _check(client.post('/api/mappings', json={
+        'form_id': form_id, 'mappings': mapping_sets[next(saves) % 2]
+    }), 201), repeat)
+
+    def generate():
+        return _check(client.post('/api/generate-pdf', json={'entity_id': entity_id, 'form_id': form_id}))
+
+    # Cold: nothing parsed or compiled yet, as after a restart
+    template_cache.clear()
+    fill_plans.invalidate(form_id)
+    result['generate_pdf_cold'] = _timings(generate, 1)
+    result['generate_pdf'] = _timings(generate, repeat)
+    result['output_bytes'] = len(generate().data)
+
+    tracemalloc.start()
+    generate()
+    result['generate_pdf_memory_bytes_peak'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def run_listing_case(count, repeat):
+    """Times entity listing with `count` rows in the table."""
+    app = bench_app()
+    seed_entities(app, count)
+    client = app.test_client()
+    result = {'entities': count}
+    result['first_page'] = _timings(lambda: _check(client.get('/api/entities?limit=50')), repeat)
+    result['narrow_page'] = _timings(lambda: _check(client.get('/api/entities?limit=50&fields=id,name')), repeat)
+
+    # A later page, reached through a real cursor
+    cursor = _check(client.get(f'/api/entities?limit={min(count // 2, 500)}&fields=id,name')).json['next_after']
+    result['cursor_page'] = _timings(lambda: _check(client.get(f'/api/entities?limit=50&after={cursor}')), repeat)
+    result['search'] = _timings(lambda: _check(client.get('/api/entities?limit=50&q=portland')), repeat)
+    if count <= LEGACY_LISTING_MAX_ROWS:
+        result['legacy_all'] = _timings(lambda: _check(client.get('/api/entities')), max(1, repeat // 5))
+    return result
+
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    """Returns a list of regressions: metrics more than `tolerance` worse than the baseline."""
+    regressions = []
+
+    def walk(path, new, old):
+        if isinstance(new, dict) and isinstance(old, dict):
+            for key in new.keys() & old.keys():
+                walk(f"{path}.{key}" if path else key, new[key], old[key])
+        elif isinstance(new, (int, float)) and isinstance(old, (int, float)) and path.endswith(COMPARED_SUFFIXES):
+            # Tiny absolute changes in fast timings are noise
+            if path.endswith('_ms') and new - old < min_delta_ms:
+                return
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append({'metric': path, 'baseline': old, 'current': new,
+                                    'change': round(new / old - 1, 3)})
+
+    walk('', current['results'], baseline.get('results', {}))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='timed calls per endpoint')
+    parser.add_argument('--mapped', type=int, default=50, help='fields mapped (and filled) per template')
+    parser.add_argument('--quick', action='store_true', help='skip the largest template and the 100k-row listing')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before failing (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore timing changes smaller than this')
+    args = parser.parse_args()
+
+    sizes = TEMPLATE_SIZES[:-1] if args.quick else TEMPLATE_SIZES
+    counts = ENTITY_COUNTS[:1] if args.quick else ENTITY_COUNTS
+
+    app = bench_app()
+    client = app.test_client()
+    entity_id = _check(client.post('/api/entities', json={
+        'name': 'Benchmark Holdings LLC', 'street_address': '1 Main St',
+        'city': 'Springfield', 'state': 'IL', 'zip_code': '62701'
+    }), 201).json['id']
+
+    results = {'templates': {}, 'listing': {}}
+    for pages, fields, content_bytes in sizes:
+        case = f"p{pages}_f{fields}"
+        print(f"Template {case}...", file=sys.stderr)
+        results['templates'][case] = run_template_case(
+            client, entity_id, pages, fields, content_bytes, args.mapped, args.repeat
+        )
+    for count in counts:
+        print(f"Listing {count} entities...", file=sys.stderr)
+        results['listing'][f"rows_{count}"] = run_listing_case(count, args.repeat)
+
+    output = {
+        'environment': {
+            'python': platform.python_version(),
+            'pypdf': pypdf.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'mapped': args.mapped,
+        },
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results,
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        output['regressions'] = compare(output, baseline, args.tolerance, args.min_delta_ms)
+        if output['regressions']:
+            status = 1
+            for regression in output['regressions']:
+                print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']}",
+                      file=sys.stderr)
+
+    text = json.dumps(output, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    sys.exit(status)
+
+
+# -main-
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+The real app, set up for benchmarking: SQLite (or any DATABASE_URL), no
+output cache, no background workers, quiet logging.
+"""
+import os
+import logging
+import tempfile
+from datetime import datetime
+from tax_form_app import create_app
+from tax_form_app.models import db, Entity, TableVersion
+
+CITIES = [('Springfield', 'IL'), ('Portland', 'OR'), ('Austin', 'TX'), ('Madison', 'WI'), ('Albany', 'NY')]
+
+
+def bench_app(database_url=None, **overrides):
+    """
+    Creates the app against `database_url` (default: a fresh SQLite file in a
+    temporary directory) with empty tables. `overrides` go to create_app's config.
+    """
+    if database_url is None:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='tax_form_bench_'), 'bench.db')}"
+    config = {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        # Every generate-pdf call should really fill
+        'OUTPUT_CACHE_MAX_BYTES': 0,
+        'FILL_POOL_WORKERS': 0,
+        'JOB_WORKER_THREADS': 0,
+        'METRICS_ENABLED': False,
+        # The same synthetic template is uploaded under several names
+        'REJECT_DUPLICATE_TEMPLATES': False,
+    }
+    config.update(overrides)
+    app = create_app(config)
+    logging.getLogger().setLevel(logging.WARNING)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def seed_entities(app, count, batch_size=10000):
+    """Inserts `count` synthetic entities with executemany batches."""
+    now = datetime.utcnow()
+    with app.app_context():
+        for start in range(0, count, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, count)):
+                city, state = CITIES[i % len(CITIES)]
+                rows.append({
+                    'name': f"Entity {i:07d} LLC",
+                    'street_address': f"{i % 9999 + 1} Main St",
+                    'city': city,
+                    'state': state,
+                    'zip_code': f"{10000 + i % 89999}",
+                    'version': 1,
+                    'created_at': now,
+                    'updated_at': now,
+                })
+            db.session.execute(db.insert(Entity), rows)
+            TableVersion.bump('entities')
+            db.session.commit()
@@ -0,0 +1,352 @@
+"""
+Concurrent load test of the HTTP API with a configurable traffic mix.
+
+Starts the app in a separate server process on a local port (SQLite by
+default, or any --database-url such as a local Postgres), or targets a
+running server with --url. The clients never share an interpreter, and so a
+GIL, with the server they measure. Seeds entities and a synthetic form, then
+runs each concurrency step for a fixed time. Every client thread picks
+operations by weight. Reports throughput, error rate and p50/p95/p99 latency
+per endpoint as JSON, plus the step where throughput stopped growing.
+
+For numbers that reflect production, run the server as it is deployed (e.g.
+gunicorn with several workers) and point --url at it.
+
+Usage: python -m benchmarks.load [--concurrency 1,2,4,8,16] [--duration 10]
+           [--mix list_entities=40,get_entity=20,update_entity=10,create_entity=5,save_mappings=5,generate_pdf=20]
+           [--burst 5] [--workers 2] [--database-url postgresql://...] [--url http://host:5000]
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import multiprocessing
+import urllib.error
+import urllib.request
+from werkzeug.serving import make_server
+from tax_form_app.models import ENTITY_FIELDS
+from tax_form_app.output_cache import DEFAULT_MAX_BYTES as OUTPUT_CACHE_BYTES
+from tax_form_app.fill_pool import fill_pool
+from .app import bench_app, CITIES
+from .synthetic import make_template, FIELD_TYPES
+
+DEFAULT_MIX = 'list_entities=40,get_entity=20,update_entity=10,create_entity=5,save_mappings=5,generate_pdf=20'
+# Throughput gain below which the next concurrency step counts as saturated
+SATURATION_GAIN = 0.1
+REQUEST_TIMEOUT = 60
+# Seconds the server process may take to start (app, database, tables)
+SERVER_START_TIMEOUT = 60
+
+
+class Client:
+    """Minimal JSON-over-HTTP client on urllib, so the harness needs nothing installed."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, content_type='application/json', headers=None):
+        """Returns (status, body bytes); HTTP errors are returned, not raised."""
+        data = body
+        if isinstance(body, (dict, list)):
+            data = json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers or {})
+        if data is not None:
+            request.add_header('Content-Type', content_type)
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def json(self, method, path, body=None, expect=200):
+        status, payload = self.request(method, path, body)
+        if status != expect:
+            raise RuntimeError(f"{method} {path} returned {status}: {payload[:200]!r}")
+        return json.loads(payload)
+
+    def upload_form(self, form_name, pdf_bytes):
+        """POSTs a template as multipart/form-data."""
+        boundary = uuid.uuid4().hex
+        body = b''.join([
+            f'--{boundary}\r\nContent-Disposition: form-data; name="form_name"\r\n\r\n{form_name}\r\n'.encode(),
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load.pdf"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'.encode(),
+            pdf_bytes,
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ])
+        status, payload = self.request('POST', '/api/forms/upload', body, f'multipart/form-data; boundary={boundary}')
+        if status != 201:
+            raise RuntimeError(f"Form upload returned {status}: {payload[:200]!r}")
+        return json.loads(payload)
+
+
+class Workload:
+    """
+    The seeded data and the operations the mix draws from.
+    Each operation returns a list of (endpoint, status, seconds), one per request made.
+    """
+
+    def __init__(self, client, entity_ids, form_id, field_names, burst):
+        self.client = client
+        self.entity_ids = entity_ids
+        self.form_id = form_id
+        self.field_names = field_names
+        self.burst = burst
+
+    def _call(self, endpoint, method, path, body=None):
+        started = time.perf_counter()
+        status, _ = self.client.request(method, path, body)
+        return endpoint, status, time.perf_counter() - started
+
+    def list_entities(self, rng):
+        if rng.random() < 0.2:
+            city, _ = rng.choice(CITIES)
+            return [self._call('GET /entities?q', 'GET', f'/api/entities?limit=50&q={city}')]
+        return [self._call('GET /entities', 'GET', '/api/entities?limit=50')]
+
+    def get_entity(self, rng):
+        return [self._call('GET /entities/<id>', 'GET', f'/api/entities/{rng.choice(self.entity_ids)}')]
+
+    def update_entity(self, rng):
+        city, state = rng.choice(CITIES)
+        return [self._call(
+            'PUT /entities/<id>', 'PUT', f'/api/entities/{rng.choice(self.entity_ids)}', {'city': city, 'state': state}
+        )]
+
+    def create_entity(self, rng):
+        city, state = rng.choice(CITIES)
+        return [self._call('POST /entities', 'POST', '/api/entities', {
+            'name': f"Load {uuid.uuid4().hex[:12]} Inc", 'city': city, 'state': state, 'zip_code': '10001'
+        })]
+
+    def save_mappings(self, rng):
+        shift = rng.randrange(len(ENTITY_FIELDS))
+        mappings = {
+            name: ENTITY_FIELDS[(i + shift) % len(ENTITY_FIELDS)] for i, name in enumerate(self.field_names)
+        }
+        return [self._call('POST /mappings', 'POST', '/api/mappings', {'form_id': self.form_id, 'mappings': mappings})]
+
+    def generate_pdf(self, rng):
+        # Generation comes in bursts, like a user exporting a batch of clients
+        entity_id = rng.choice(self.entity_ids)
+        return [
+            self._call('POST /generate-pdf', 'POST', '/api/generate-pdf', {'entity_id': entity_id, 'form_id': self.form_id})
+            for _ in range(self.burst)
+        ]
+
+
+def parse_mix(text):
+    """Parses 'operation=weight,...' into a list of (operation, weight)."""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Workload, name) or name.startswith('_'):
+            raise ValueError(f"Unknown operation '{name}'")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def setup(client, entities, pages, fields, mapped, burst):
+    """Seeds entities through the import endpoint and uploads a mapped synthetic form."""
+    lines = []
+    for i in range(entities):
+        city, state = CITIES[i % len(CITIES)]
+        lines.append(json.dumps({'name': f"Load Entity {i:07d}", 'city': city, 'state': state, 'zip_code': '10001'}))
+    status, payload = client.request(
+        'POST', '/api/entities/import', ('\n'.join(lines) + '\n').encode('utf-8'), 'application/x-ndjson'
+    )
+    if status != 200:
+        raise RuntimeError(f"Entity import returned {status}: {payload[:200]!r}")
+
+    status, payload = client.request('GET', '/api/entities/export?fields=id')
+    entity_ids = [json.loads(line)['id'] for line in payload.splitlines() if line.strip()]
+
+    template, names = make_template(pages, fields, 2000, FIELD_TYPES)
+    form_id = client.upload_form(f"load-test-{uuid.uuid4().hex[:8]}", template)['id']
+    field_names = names[:mapped]
+    client.json('POST', '/api/mappings', {
+        'form_id': form_id,
+        'mappings': {name: ENTITY_FIELDS[i % len(ENTITY_FIELDS)] for i, name in enumerate(field_names)}
+    }, expect=201)
+    return Workload(client, entity_ids, form_id, field_names, burst)
+
+
+def _percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+
+def run_step(workload, mix, concurrency, duration, seed):
+    """Runs `concurrency` client threads for `duration` seconds; returns the step report."""
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    samples = {} # endpoint -> list of (seconds, status)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client_loop(thread_index):
+        rng = random.Random(seed * 1000 + thread_index)
+        local = []
+        while time.monotonic() < deadline:
+            operation = getattr(workload, rng.choices(names, weights)[0])
+            started = time.perf_counter()
+            try:
+                local.extend(operation(rng))
+            except Exception as e:
+                # Connection refused/reset or a client timeout: the server is past saturation
+                local.append((f'{operation.__name__} (connection)', type(e).__name__, time.perf_counter() - started))
+        with lock:
+            for endpoint, status, elapsed in local:
+                samples.setdefault(endpoint, []).append((elapsed, status))
+
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    endpoints = {}
+    total = errors = 0
+    for endpoint, entries in sorted(samples.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _ in entries)
+        statuses = {}
+        for _, status in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        failed = sum(1 for _, status in entries if not (isinstance(status, int) and status < 400))
+        total += len(entries)
+        errors += failed
+        endpoints[endpoint] = {
+            'requests': len(entries),
+            'throughput_rps': round(len(entries) / wall, 2),
+            'error_rate': round(failed / len(entries), 4),
+            'p50_ms': round(_percentile(latencies, 0.50), 2),
+            'p95_ms': round(_percentile(latencies, 0.95), 2),
+            'p99_ms': round(_percentile(latencies, 0.99), 2),
+            'statuses': statuses,
+        }
+    return {
+        'concurrency': concurrency,
+        'seconds': round(wall, 2),
+        'requests': total,
+        'throughput_rps': round(total / wall, 2) if wall else 0,
+        'error_rate': round(errors / total, 4) if total else 0,
+        'endpoints': endpoints,
+    }
+
+
+def saturation_point(steps):
+    """The first concurrency whose throughput gained less than SATURATION_GAIN over the step before."""
+    for previous, step in zip(steps, steps[1:]):
+        if step['throughput_rps'] < previous['throughput_rps'] * (1 + SATURATION_GAIN):
+            return step['concurrency']
+    return None
+
+
+def _server_main(database_url, overrides, conn):
+    """Server process: serves the benchmark app until the harness says stop (or goes away)."""
+    server = make_server('127.0.0.1', 0, bench_app(database_url, **overrides), threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    conn.send(server.server_port)
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+    server.shutdown()
+    # A process started by multiprocessing skips the interpreter's own pool cleanup at exit
+    fill_pool.shutdown(wait=True)
+
+
+def serve(database_url, overrides):
+    """Starts the app in its own process on a free local port; returns (stop function, base url)."""
+    # Not a daemon: the app's fill pool starts processes of its own
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.get_context('spawn').Process(
+        target=_server_main, args=(database_url, overrides, child_conn), name='load-test-server'
+    )
+    process.start()
+    if not conn.poll(SERVER_START_TIMEOUT):
+        process.terminate()
+        raise RuntimeError('The load-test server did not start')
+    port = conn.recv()
+
+    def stop():
+        conn.send('stop')
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+    return stop, f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='base URL of a running server; by default the app is started in a local server process')
+    parser.add_argument('--database-url', help='database for the local server (default: a temporary SQLite file)')
+    parser.add_argument('--workers', type=int, default=2, help='FILL_POOL_WORKERS for the local server')
+    parser.add_argument('--queue-size', type=int, default=0, help='FILL_QUEUE_SIZE for the local server')
+    parser.add_argument('--output-cache', action='store_true', help='keep the generated-PDF cache on')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='comma-separated client thread counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per concurrency step')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation=weight pairs')
+    parser.add_argument('--burst', type=int, default=5, help='generate-pdf calls per generate_pdf operation')
+    parser.add_argument('--entities', type=int, default=1000, help='entities seeded before the run')
+    parser.add_argument('--pages', type=int, default=10, help='pages of the synthetic form')
+    parser.add_argument('--fields', type=int, default=100, help='fields of the synthetic form')
+    parser.add_argument('--mapped', type=int, default=30, help='fields mapped and filled')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the operation sequence')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    stop_server = None
+    if args.url:
+        base_url = args.url
+    else:
+        overrides = {
+            'FILL_POOL_WORKERS': args.workers,
+            'FILL_QUEUE_SIZE': args.queue_size,
+        }
+        if args.output_cache:
+            overrides['OUTPUT_CACHE_MAX_BYTES'] = OUTPUT_CACHE_BYTES
+        stop_server, base_url = serve(args.database_url, overrides)
+
+    try:
+        client = Client(base_url)
+        print(f"Seeding {args.entities} entities and a {args.pages}-page form at {base_url}...", file=sys.stderr)
+        workload = setup(client, args.entities, args.pages, args.fields, args.mapped, args.burst)
+        steps = []
+        for concurrency in (int(value) for value in args.concurrency.split(',')):
+            print(f"Running {concurrency} clients for {args.duration}s...", file=sys.stderr)
+            steps.append(run_step(workload, mix, concurrency, args.duration, args.seed))
+            print(f"  {steps[-1]['throughput_rps']} req/s, error rate {steps[-1]['error_rate']}", file=sys.stderr)
+    finally:
+        if stop_server is not None:
+            stop_server()
+
+    report = {
+        'target': base_url if args.url else 'local server process',
+        'config': {
+            'mix': dict(mix),
+            'burst': args.burst,
+            'duration_seconds': args.duration,
+            'entities': args.entities,
+            'form': {'pages': args.pages, 'fields': args.fields, 'mapped': args.mapped},
+            'fill_pool_workers': None if args.url else args.workers,
+        },
+        'steps': steps,
+        'saturation_concurrency': saturation_point(steps),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+# -main-
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compares the 'full' and 'incremental' PDF output modes on synthetic templates.
+
+For each template size, fills the same fields in both modes from one parsed
+reader (as the template cache does) and reports the median fill time and the
+output size. Prints JSON.
+
+Usage: python -m benchmarks.output_modes [--repeat 20] [--filled 10]
+"""
+import io
+import json
+import time
+import argparse
+import statistics
+from pypdf import PdfReader
+from tax_form_app.filling import fill_reader, OUTPUT_MODES
+from tax_form_app.fill_plan import compile_plan
+from tax_form_app.pdf_fields import widget_positions
+from .synthetic import make_template
+
+# (pages, fields, content bytes per page)
+TEMPLATE_SIZES = [
+    (1, 20, 2000),
+    (10, 100, 2000),
+    (50, 500, 5000),
+    (200, 2000, 5000),
+]
+
+
+class _Mapping:
+    def __init__(self, pdf_field_name):
+        self.pdf_field_name = pdf_field_name
+        self.entity_field_name = 'name'
+
+
+def _plan_pages(reader, names, filled):
+    """A fill plan's pages tuple for the first `filled` fields."""
+    catalog = widget_positions(reader).items()
+    return compile_plan(None, catalog, [_Mapping(name) for name in names[:filled]], 0).pages
+
+
+def run_case(pages, fields, content_bytes, filled, repeat):
+    """Times both output modes for one template size."""
+    template, names = make_template(pages, fields, content_bytes)
+    reader = PdfReader(io.BytesIO(template))
+    plan_pages = _plan_pages(reader, names, filled)
+    fill_data = {name: f"Value {i}" for i, name in enumerate(names[:filled])}
+
+    result = {
+        'pages': pages,
+        'fields': fields,
+        'filled': len(fill_data),
+        'template_bytes': len(template),
+    }
+    for mode in OUTPUT_MODES:
+        # One untimed fill warms the reader's object cache
+        output = fill_reader(reader, fill_data, pages=plan_pages, mode=mode)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fill_reader(reader, fill_data, pages=plan_pages, mode=mode)
+            timings.append(time.perf_counter() - start)
+        result[mode] = {
+            'median_ms': round(statistics.median(timings) * 1000, 2),
+            'output_bytes': len(output),
+            'appended_bytes': len(output) - len(template) if output.startswith(template) else None,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help='timed fills per mode and template')
+    parser.add_argument('--filled', type=int, default=10, help='fields filled per document')
+    args = parser.parse_args()
+
+    results = [
+        run_case(pages, fields, content_bytes, args.filled, args.repeat)
+        for pages, fields, content_bytes in TEMPLATE_SIZES
+    ]
+    print(json.dumps(results, indent=2))
+
+
+# -main-
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Synthetic AcroForm templates for benchmarks, built with pypdf so no fixture files are needed.
+"""
+import io
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject, DictionaryObject, FloatObject, NameObject, NumberObject, StreamObject, TextStringObject
+)
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+FIELD_TYPES = ('text', 'checkbox', 'choice')
+CHOICE_OPTIONS = ['Single', 'Married filing jointly', 'Married filing separately', 'Head of household']
+
+
+def field_name(page_index, i):
+    """Name of the i-th synthetic field on a page."""
+    return f"p{page_index}_f{i}"
+
+
+def field_type(i, field_types=('text',)):
+    """Type of the i-th synthetic field on a page: types are assigned round robin."""
+    return field_types[i % len(field_types)]
+
+
+def sample_value(kind, i=0):
+    """A value that fills a synthetic field of the given type."""
+    if kind == 'checkbox':
+        return '/Yes'
+    if kind == 'choice':
+        return CHOICE_OPTIONS[i % len(CHOICE_OPTIONS)]
+    return f"Value {i}"
+
+
+def _appearance(writer, width, height, content=b""):
+    stream = StreamObject()
+    stream.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject([FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height)]),
+    })
+    stream.set_data(content)
+    return writer._add_object(stream)
+
+
+def _type_entries(writer, kind):
+    """The field dictionary entries that make a widget a text field, checkbox or combo box."""
+    if kind == 'checkbox':
+        return {
+            NameObject('/FT'): NameObject('/Btn'),
+            NameObject('/V'): NameObject('/Off'),
+            NameObject('/AS'): NameObject('/Off'),
+            NameObject('/AP'): DictionaryObject({NameObject('/N'): DictionaryObject({
+                NameObject('/Yes'): _appearance(writer, 14, 14, b"q 0 g 2 2 10 10 re f Q"),
+                NameObject('/Off'): _appearance(writer, 14, 14),
+            })}),
+        }
+    if kind == 'choice':
+        return {
+            NameObject('/FT'): NameObject('/Ch'),
+            NameObject('/Ff'): NumberObject(1 << 17), # combo box
+            NameObject('/Opt'): ArrayObject([TextStringObject(option) for option in CHOICE_OPTIONS]),
+        }
+    return {NameObject('/FT'): NameObject('/Tx')}
+
+
+def _page_content(page_index, content_bytes):
+    """A text content stream of roughly `content_bytes`, standing in for the printed form."""
+    lines = [b"BT /Helv 8 Tf 40 760 Td 10 TL"]
+    line = f"(Page {page_index + 1} - instructions and boilerplate text for this section) Tj T*".encode()
+    while sum(len(part) + 1 for part in lines) < content_bytes:
+        lines.append(line)
+    lines.append(b"ET")
+    stream = StreamObject()
+    stream.set_data(b"\n".join(lines))
+    return stream
+
+
+def make_template(pages=10, fields=100, content_bytes=2000, field_types=('text',)):
+    """
+    Builds a PDF with `fields` fields spread evenly over `pages` pages.
+    `field_types` are assigned round robin on each page (see field_type).
+    Returns (pdf bytes, list of field names).
+    """
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    }))
+    names = []
+    all_fields = ArrayObject()
+    per_page = max(1, -(-fields // pages))
+
+    for page_index in range(pages):
+        page = writer.add_blank_page(PAGE_WIDTH, PAGE_HEIGHT)
+        page[NameObject('/Contents')] = writer._add_object(_page_content(page_index, content_bytes))
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/Helv'): font})
+        })
+        annots = ArrayObject()
+        for i in range(min(per_page, fields - len(names))):
+            name = field_name(page_index, i)
+            row, column = divmod(i, 2)
+            x = 40 + column * 280
+            y = PAGE_HEIGHT - 60 - (row % 45) * 16
+            kind = field_type(i, field_types)
+            width = 14 if kind == 'checkbox' else 250
+            field = DictionaryObject({
+                NameObject('/Type'): NameObject('/Annot'),
+                NameObject('/Subtype'): NameObject('/Widget'),
+                NameObject('/T'): TextStringObject(name),
+                NameObject('/TU'): TextStringObject(f"Page {page_index + 1} field {i + 1}"),
+                NameObject('/Rect'): ArrayObject([FloatObject(x), FloatObject(y), FloatObject(x + width), FloatObject(y + 14)]),
+                NameObject('/DA'): TextStringObject('/Helv 9 Tf 0 g'),
+                NameObject('/P'): page.indirect_reference,
+            })
+            field.update(_type_entries(writer, kind))
+            ref = writer._add_object(field)
+            annots.append(ref)
+            all_fields.append(ref)
+            names.append(name)
+        if annots:
+            page[NameObject('/Annots')] = annots
+
+    writer._root_object[NameObject('/AcroForm')] = DictionaryObject({
+        NameObject('/Fields'): all_fields,
+        NameObject('/DA'): TextStringObject('/Helv 0 Tf 0 g'),
+        NameObject('/DR'): DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/Helv'): font})
+        }),
+    })
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue(), names
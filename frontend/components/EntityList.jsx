@@ -190,21 +190,38 @@ function EntityPdfGenerator({ entity, formList }) {
   );
 }
 
+// Page size and columns for the entity list (the list never shows created_at etc.)
+const PAGE_SIZE = 50;
+const LIST_FIELDS = "id,name,street_address,city,state,zip_code";
+
 function EntityList() {
   const [entities, setEntities] = useState([]);
   const [formList, setFormList] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
-
-  const fetchEntities = async () => {
+  const [search, setSearch] = useState("");
+  const [nextAfter, setNextAfter] = useState(null);
+
+  const fetchPage = (after, query) =>
+    axios.get(`${API_URL}/entities`, {
+      params: {
+        limit: PAGE_SIZE,
+        fields: LIST_FIELDS,
+        ...(query ? { q: query } : {}),
+        ...(after ? { after } : {}),
+      },
+    });
+
+  const fetchEntities = async (query = search) => {
     try {
       setLoading(true);
       const [entitiesRes, formsRes] = await Promise.all([
-        axios.get(`${API_URL}/entities`),
+        fetchPage(null, query),
         axios.get(`${API_URL}/forms`),
       ]);
 
-      setEntities(entitiesRes.data);
+      setEntities(entitiesRes.data.entities);
+      setNextAfter(entitiesRes.data.next_after);
       setFormList(formsRes.data);
       setError(null);
     } catch (err) {
@@ -215,6 +232,25 @@ function EntityList() {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      setLoading(true);
+      const response = await fetchPage(nextAfter, search);
+      setEntities([...entities, ...response.data.entities]);
+      setNextAfter(response.data.next_after);
+    } catch (err) {
+      console.error("Error:", err);
+      setError("Failed loading more entities");
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const handleSearch = (e) => {
+    e.preventDefault();
+    fetchEntities(search);
+  };
+
   const handleDelete = async (idToDelete) => {
     if (!window.confirm("Are you sure you want to delete this entity?")) {
       return;
@@ -247,6 +283,17 @@ function EntityList() {
 
       <div className="page-section">
         <h3>All Entities</h3>
+        <form onSubmit={handleSearch} className="form-selector">
+          <input
+            type="text"
+            value={search}
+            onChange={(e) => setSearch(e.target.value)}
+            placeholder="Search name, city, state or zip"
+          />
+          <button type="submit" className="button" disabled={loading}>
+            Search
+          </button>
+        </form>
         <div className="entity-list">
           {entities.length === 0 ? (
             <p>No entities found. Add one below.</p>
@@ -282,11 +329,16 @@ function EntityList() {
             ))
           )}
         </div>
+        {nextAfter && (
+          <button onClick={loadMore} disabled={loading} className="button">
+            {loading ? "Loading..." : "Load more"}
+          </button>
+        )}
       </div>
 
       <hr />
 
-      <EntityForm onEntityAdded={fetchEntities} />
+      <EntityForm onEntityAdded={() => fetchEntities()} />
     </div>
   );
 }
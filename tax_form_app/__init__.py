@@ -1,14 +1,29 @@
 import os
 import logging
+import multiprocessing
 from flask import Flask, jsonify
 from flask_cors import CORS
 
 #db imported from models
 from .models import db
+from .template_cache import template_cache, DEFAULT_MAX_BYTES
+from .fill_pool import (
+    fill_pool, DEFAULT_WORKERS, DEFAULT_BATCH_SIZE, DEFAULT_TIMEOUT, DEFAULT_QUEUE_WAIT, DEFAULT_RETRY_AFTER,
+    DEFAULT_SPOOL_DIR
+)
+from .output_cache import output_cache, DEFAULT_DIRECTORY, DEFAULT_MAX_BYTES as DEFAULT_OUTPUT_CACHE_BYTES
+from .metrics import metrics
+from .blob_store import DEFAULT_MAX_TEMPLATE_BYTES
+from . import http_cache
+from . import database
 
-def create_app():
+def create_app(config=None):
     """
     Application Factory: Creates and configures the Flask app.
+    `config` overrides settings that otherwise come from the environment
+    (e.g. {'SQLALCHEMY_DATABASE_URI': 'sqlite://'} for benchmarks).
+    DATABASE_URL=sqlite:// runs on an in-memory SQLite database with its tables
+    created on startup; no Postgres server is needed.
     """
     
     logging.basicConfig(level=logging.DEBUG)
@@ -17,6 +32,7 @@ def create_app():
 
     app = Flask(__name__)
     CORS(app) #CORS issue? need to debug
+    app.config.update(config or {})
 
      # PostgreSQL credentials// not sure why postgresql profile variants are misbehaving..
     DB_USER = os.environ.get('DB_USER', 'postgres')
@@ -26,13 +42,98 @@ def create_app():
     DB_NAME = os.environ.get('DB_NAME', 'tax_filler_db')
 
     # ?? sqlalchemy documentat
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    # DATABASE_URL (e.g. sqlite:///bench.db) replaces the DB_* settings
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get(
+        'DATABASE_URL', f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    ))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Connection pool (Postgres): size, overflow, checkout wait, recycle age and liveness check
+    app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', database.DEFAULT_POOL_SIZE)))
+    app.config.setdefault('DB_MAX_OVERFLOW', int(os.environ.get('DB_MAX_OVERFLOW', database.DEFAULT_MAX_OVERFLOW)))
+    app.config.setdefault('DB_POOL_TIMEOUT', int(os.environ.get('DB_POOL_TIMEOUT', database.DEFAULT_POOL_TIMEOUT)))
+    app.config.setdefault('DB_POOL_RECYCLE', int(os.environ.get('DB_POOL_RECYCLE', database.DEFAULT_POOL_RECYCLE)))
+    app.config.setdefault('DB_POOL_PRE_PING', os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'))
+    # Server-side limit per statement on Postgres (0 = none), and how long SQLite waits for a lock
+    app.config.setdefault('DB_STATEMENT_TIMEOUT_MS', int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', database.DEFAULT_STATEMENT_TIMEOUT_MS)))
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_SECONDS', float(os.environ.get('SQLITE_BUSY_TIMEOUT_SECONDS', database.DEFAULT_SQLITE_BUSY_TIMEOUT)))
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config))
+
+    # Read replica for the read-only routes (listing, field catalog, debug)
+    app.config.setdefault('DATABASE_REPLICA_URL', os.environ.get('DATABASE_REPLICA_URL'))
+    if app.config['DATABASE_REPLICA_URL']:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[database.REPLICA_BIND] = {
+            'url': app.config['DATABASE_REPLICA_URL'],
+            **database.engine_options(app.config['DATABASE_REPLICA_URL'], app.config)
+        }
+
     db.init_app(app)
+    database.init_app(app, db)
+
+    # Parsed-template cache budget, in bytes of template data
+    app.config.setdefault('TEMPLATE_CACHE_MAX_BYTES', int(os.environ.get('TEMPLATE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
+    template_cache.configure(app.config['TEMPLATE_CACHE_MAX_BYTES'])
+
+    # Generated-PDF cache on disk (0 bytes disables it)
+    app.config.setdefault('OUTPUT_CACHE_DIR', os.environ.get('OUTPUT_CACHE_DIR', DEFAULT_DIRECTORY))
+    app.config.setdefault('OUTPUT_CACHE_MAX_BYTES', int(os.environ.get('OUTPUT_CACHE_MAX_BYTES', DEFAULT_OUTPUT_CACHE_BYTES)))
+    output_cache.configure(app.config['OUTPUT_CACHE_DIR'], app.config['OUTPUT_CACHE_MAX_BYTES'])
+
+    # Worker processes for PDF filling, per server process (0 fills inline in the request thread)
+    app.config.setdefault('FILL_POOL_WORKERS', int(os.environ.get('FILL_POOL_WORKERS', DEFAULT_WORKERS)))
+    app.config.setdefault('FILL_BATCH_SIZE', int(os.environ.get('FILL_BATCH_SIZE', DEFAULT_BATCH_SIZE)))
+    # Admission: single-document fills in flight (0 = 4 per worker), how long to wait for a slot,
+    # how long a fill may take, and the Retry-After sent with 503s
+    app.config.setdefault('FILL_QUEUE_SIZE', int(os.environ.get('FILL_QUEUE_SIZE', 0)))
+    app.config.setdefault('FILL_QUEUE_WAIT_SECONDS', float(os.environ.get('FILL_QUEUE_WAIT_SECONDS', DEFAULT_QUEUE_WAIT)))
+    app.config.setdefault('FILL_TIMEOUT_SECONDS', float(os.environ.get('FILL_TIMEOUT_SECONDS', DEFAULT_TIMEOUT)))
+    app.config.setdefault('FILL_RETRY_AFTER_SECONDS', int(os.environ.get('FILL_RETRY_AFTER_SECONDS', DEFAULT_RETRY_AFTER)))
+    # Where template bytes are written for the pool workers to read
+    app.config.setdefault('FILL_SPOOL_DIR', os.environ.get('FILL_SPOOL_DIR', DEFAULT_SPOOL_DIR))
+    fill_pool.configure(
+        app.config['FILL_POOL_WORKERS'],
+        app.config['FILL_BATCH_SIZE'],
+        queue_size=app.config['FILL_QUEUE_SIZE'],
+        timeout=app.config['FILL_TIMEOUT_SECONDS'],
+        queue_wait=app.config['FILL_QUEUE_WAIT_SECONDS'],
+        retry_after=app.config['FILL_RETRY_AFTER_SECONDS'],
+        spool_dir=app.config['FILL_SPOOL_DIR']
+    )
+
+    # Background generation jobs: batch size, polling and stale-claim timeout
+    app.config.setdefault('JOB_BATCH_SIZE', int(os.environ.get('JOB_BATCH_SIZE', 200)))
+    app.config.setdefault('JOB_POLL_SECONDS', float(os.environ.get('JOB_POLL_SECONDS', 2)))
+    app.config.setdefault('JOB_STALE_SECONDS', int(os.environ.get('JOB_STALE_SECONDS', 300)))
+    app.config.setdefault('JOB_WORKER_THREADS', int(os.environ.get('JOB_WORKER_THREADS', 0)))
 
-    from . import routes
+    # Template uploads: size limit, and whether bytes identical to an existing form are turned away
+    app.config.setdefault('MAX_TEMPLATE_BYTES', int(os.environ.get('MAX_TEMPLATE_BYTES', DEFAULT_MAX_TEMPLATE_BYTES)))
+    app.config.setdefault('REJECT_DUPLICATE_TEMPLATES', os.environ.get('REJECT_DUPLICATE_TEMPLATES', 'true').lower() in ('1', 'true', 'yes'))
+
+    # Templates preloaded by tax_form_app.app before a pre-fork server forks (0 = off)
+    app.config.setdefault('WARM_START_FORMS', int(os.environ.get('WARM_START_FORMS', 0)))
+
+    # Rows per batch (and per transaction) for bulk entity imports
+    app.config.setdefault('ENTITY_IMPORT_BATCH_SIZE', int(os.environ.get('ENTITY_IMPORT_BATCH_SIZE', 1000)))
+
+    # Per-stage Server-Timing headers and Prometheus metrics at /metrics
+    app.config.setdefault('METRICS_ENABLED', os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes'))
+    metrics.init_app(app)
+
+    # gzip/br for JSON bodies from this size on (-1 disables compression)
+    app.config.setdefault('COMPRESS_MIN_BYTES', int(os.environ.get('COMPRESS_MIN_BYTES', http_cache.DEFAULT_COMPRESS_MIN_BYTES)))
+    http_cache.init_app(app)
+
+    from . import routes, jobs
     app.register_blueprint(routes.api)
+    app.register_blueprint(jobs.jobs)
+
+    # In-process job workers; otherwise run `python -m tax_form_app.worker`.
+    # Not in fill pool processes: spawn re-imports the server's main module, and with it create_app.
+    # (parent_process() is only set once that import is done; the process name is set before it.)
+    if app.config['JOB_WORKER_THREADS'] > 0 and multiprocessing.current_process().name == 'MainProcess':
+        from .worker import start_worker_threads
+        start_worker_threads(app, app.config['JOB_WORKER_THREADS'])
 
     # --- Root/Health Check Route ---
     @app.route('/')
@@ -1,4 +1,5 @@
 import logging
+import multiprocessing
 from . import create_app
 from .models import db
 
@@ -8,6 +9,12 @@ logger = logging.getLogger(__name__)
 #app factory implemented
 app = create_app()
 
+# With a preloading server (gunicorn --preload) this runs once, before the workers fork.
+# Fill pool processes re-import this module when run as __main__; they warm up from FillPool.preload instead.
+if app.config['WARM_START_FORMS'] > 0 and multiprocessing.current_process().name == 'MainProcess':
+    from .warmup import warm_start
+    warm_start(app, app.config['WARM_START_FORMS'])
+
 # -main-
 if __name__ == '__main__':
     # core loop
@@ -0,0 +1,100 @@
+import hashlib
+import logging
+from .models import db, PdfBlob, PdfForm, PdfFormField
+from .template_cache import template_cache
+from .fill_pool import fill_pool
+from .metrics import metrics
+from .pdf_fields import extract_field_catalog
+from .database import use_primary
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Largest template accepted by upload (scanned state forms run up to ~80 MB)
+DEFAULT_MAX_TEMPLATE_BYTES = 100 * 1024 * 1024
+# Bytes hashed per read when hashing a stream
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def compute_hash(file_data):
+    """Returns the SHA-256 hex digest used to address template contents."""
+    return hashlib.sha256(file_data).hexdigest()
+
+
+def hash_stream(stream):
+    """
+    Returns (SHA-256 hex digest, size) of a seekable stream, read in chunks,
+    and rewinds it so it can be parsed next.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def put_blob(file_data, content_hash=None):
+    """
+    Stores template bytes under their SHA-256 and returns the hash.
+    Identical uploads share one row. The caller commits.
+    """
+    content_hash = content_hash or compute_hash(file_data)
+    exists = db.session.query(PdfBlob.sha256).filter_by(sha256=content_hash).first()
+    if not exists:
+        db.session.add(PdfBlob(sha256=content_hash, size=len(file_data), data=file_data))
+    else:
+        logger.info(f"Template bytes {content_hash[:12]} already stored, deduplicated")
+    return content_hash
+
+
+def read_blob(content_hash):
+    """Fetches the template bytes for a hash, or None if missing."""
+    with metrics.stage('template_read'):
+        file_data = db.session.execute(
+            db.select(PdfBlob.data).where(PdfBlob.sha256 == content_hash)
+        ).scalar_one_or_none()
+    if file_data is not None:
+        metrics.count_template_bytes(len(file_data))
+    return file_data
+
+
+def release_blob(content_hash):
+    """
+    Deletes the bytes for a hash once no form references them.
+    Call after the referencing form is deleted and flushed; the caller commits.
+    """
+    still_used = db.session.query(PdfForm.id).filter_by(file_hash=content_hash).first()
+    if not still_used:
+        PdfBlob.query.filter_by(sha256=content_hash).delete()
+        fill_pool.discard_template(content_hash)
+
+
+def load_template(form):
+    """
+    Returns the parsed template for a form from the template cache.
+    The template bytes are only fetched from the blob store on a cache miss.
+    """
+    return template_cache.get(form.id, form.file_hash, lambda: read_blob(form.file_hash))
+
+
+def ensure_catalog(form):
+    """
+    Builds and stores the field catalog for forms uploaded before catalogs
+    existed, or whose catalog predates widget positions (see migrate).
+    """
+    if form.page_count is not None:
+        return
+    # The form may have been read from a lagging replica; decide, write and read back on the primary
+    use_primary()
+    db.session.refresh(form)
+    if form.page_count is not None:
+        return
+    template = load_template(form)
+    with template.lock:
+        catalog = extract_field_catalog(template.reader, template.fields)
+        form.page_count = len(template.reader.pages)
+    form.catalog = [PdfFormField(**entry) for entry in catalog]
+    db.session.commit()
+    logger.info(f"Backfilled field catalog for form ID {form.id} ({len(catalog)} fields)")
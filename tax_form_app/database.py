@@ -0,0 +1,123 @@
+"""
+Database engine settings and read-replica routing.
+
+engine_options() turns the DB_* settings into SQLAlchemy engine arguments:
+- Postgres: a bounded QueuePool (size, overflow, checkout timeout), recycled
+  connections, pre-ping so connections the server dropped are replaced instead
+  of failing the request, and a server-side statement_timeout.
+- SQLite: in-memory databases share one connection (StaticPool) and get their
+  tables on startup; file databases wait on locks instead of failing at once.
+  Both enforce foreign keys like Postgres does.
+
+With DATABASE_REPLICA_URL set, plain SELECTs of routes decorated with
+@replica_reads go to the replica; writes, locking reads and everything outside
+those routes stay on the primary. A replica route that has to write (e.g. a
+lazy catalog backfill) calls use_primary() first, so it decides and reads back
+on the primary rather than on a replica that may lag behind.
+"""
+import functools
+import logging
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT = 30 # seconds to wait for a free connection
+DEFAULT_POOL_RECYCLE = 1800 # seconds; stays under typical proxy/firewall idle cut-offs
+DEFAULT_STATEMENT_TIMEOUT_MS = 30000 # 0 = no limit
+DEFAULT_SQLITE_BUSY_TIMEOUT = 30 # seconds
+
+REPLICA_BIND = 'replica'
+
+
+def is_memory_sqlite(uri):
+    """True for sqlite:// and other in-memory SQLite URIs."""
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and (
+        url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+    )
+
+
+def engine_options(uri, config):
+    """SQLAlchemy engine arguments for `uri` from the app's DB_* settings."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        if is_memory_sqlite(uri):
+            # Every connection to :memory: would be a new, empty database
+            return {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+        return {'connect_args': {'check_same_thread': False, 'timeout': config['SQLITE_BUSY_TIMEOUT_SECONDS']}}
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if url.get_backend_name() == 'postgresql' and config['DB_STATEMENT_TIMEOUT_MS'] > 0:
+        # Set per connection by the server, so it also bounds statements the ORM issues implicitly
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def _sqlite_file_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # Readers don't block the writer (job workers write while the API reads)
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+
+def init_app(app, db):
+    """Sets up SQLite connections and creates the tables of an in-memory database."""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name != 'sqlite':
+                continue
+            event.listen(engine, 'connect', _sqlite_pragmas)
+            if not is_memory_sqlite(engine.url):
+                event.listen(engine, 'connect', _sqlite_file_pragmas)
+        if is_memory_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+            # Nothing else could have created them
+            db.create_all()
+            logger.info("Created tables in the in-memory SQLite database")
+
+
+def replica_reads(view):
+    """Marks a read-only route: its plain SELECTs may be served by the replica."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.replica_reads = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def use_primary():
+    """Sends the rest of the current request's reads to the primary."""
+    if has_request_context():
+        g.replica_reads = False
+
+
+class RoutingSession(Session):
+    """
+    Session that sends the SELECTs of @replica_reads routes to the replica
+    bind, if one is configured. Flushes and SELECT ... FOR UPDATE use the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_request_context() and g.get('replica_reads')
+                and REPLICA_BIND in self._db.engines
+                and getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
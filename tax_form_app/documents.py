@@ -0,0 +1,180 @@
+"""
+Dependency tracking for generated documents.
+
+generated_documents holds one row per (entity, form) pair that has stored
+output, with the entity and mapping versions it was generated from. Together
+with field_mappings (which forms read which entity field) that is the
+dependency index: entity field -> forms -> generated documents.
+
+Writes flag only the pairs whose output they change. An entity update marks
+the documents of forms that map one of the changed fields, a mapping save or
+an output mode change marks every document of that form. Regeneration then
+queues just the stale pairs instead of every client document.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import db, Entity, PdfForm, FieldMapping, GenerationJob, GenerationJobItem, GeneratedDocument
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Entity ids per UPDATE/DELETE statement, so IN lists stay a manageable size
+ID_CHUNK = 1000
+
+_UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _chunks(ids):
+    ids = list(ids)
+    return [ids[i:i + ID_CHUNK] for i in range(0, len(ids), ID_CHUNK)]
+
+
+def record_generated(form_id, mapping_version, output_mode, generated):
+    """
+    Records fresh output for `generated`, a list of (entity, job item id) pairs
+    filled for one form at `mapping_version`, in the caller's transaction.
+    """
+    if not generated:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            'entity_id': entity.id, 'form_id': form_id, 'job_item_id': item_id,
+            'entity_version': entity.version, 'mapping_version': mapping_version,
+            'output_mode': output_mode, 'generated_at': now,
+            'stale': False, 'stale_since': None, 'stale_reason': None,
+        }
+        for entity, item_id in generated
+    ]
+    insert = _UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        # One statement, and safe against another worker writing the same pair
+        statement = insert(GeneratedDocument).values(rows)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['entity_id', 'form_id'],
+            set_={column: statement.excluded[column] for column in rows[0] if column not in ('entity_id', 'form_id')}
+        ))
+    else:
+        existing = {
+            document.entity_id: document
+            for document in GeneratedDocument.query.filter(
+                GeneratedDocument.form_id == form_id,
+                GeneratedDocument.entity_id.in_([row['entity_id'] for row in rows])
+            )
+        }
+        for row in rows:
+            document = existing.get(row['entity_id'])
+            if document is None:
+                db.session.add(GeneratedDocument(**row))
+            else:
+                for column, value in row.items():
+                    setattr(document, column, value)
+        db.session.flush()
+
+    # An entity or mapping edited while the batch was filling may have been read before the edit
+    db.session.execute(
+        db.update(GeneratedDocument)
+        .where(
+            GeneratedDocument.form_id == form_id,
+            GeneratedDocument.entity_id.in_([row['entity_id'] for row in rows]),
+            db.or_(
+                GeneratedDocument.entity_version < db.select(Entity.version)
+                .where(Entity.id == GeneratedDocument.entity_id).scalar_subquery(),
+                GeneratedDocument.mapping_version < db.select(PdfForm.mapping_version)
+                .where(PdfForm.id == GeneratedDocument.form_id).scalar_subquery()
+            )
+        )
+        .values(stale=True, stale_since=now, stale_reason='changed during generation')
+        .execution_options(synchronize_session=False)
+    )
+
+
+def mark_entities_changed(entity_ids, changed_fields):
+    """
+    Flags the documents of `entity_ids` on every form that maps one of
+    `changed_fields`. Returns the number of documents newly marked stale.
+    """
+    changed_fields = sorted(set(changed_fields))
+    if not entity_ids or not changed_fields:
+        return 0
+    affected_forms = db.select(FieldMapping.form_id).where(FieldMapping.entity_field_name.in_(changed_fields))
+    now = datetime.utcnow()
+    marked = 0
+    for chunk in _chunks(entity_ids):
+        marked += db.session.execute(
+            db.update(GeneratedDocument)
+            .where(
+                GeneratedDocument.entity_id.in_(chunk),
+                GeneratedDocument.stale.is_(False),
+                GeneratedDocument.form_id.in_(affected_forms)
+            )
+            .values(stale=True, stale_since=now, stale_reason=','.join(changed_fields)[:255])
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    if marked:
+        logger.info(f"Marked {marked} documents stale: {changed_fields} changed on {len(entity_ids)} entities")
+    return marked
+
+
+def mark_form_changed(form_id, reason):
+    """Flags every document of a form, e.g. after its mappings changed. Returns the count."""
+    marked = db.session.execute(
+        db.update(GeneratedDocument)
+        .where(GeneratedDocument.form_id == form_id, GeneratedDocument.stale.is_(False))
+        .values(stale=True, stale_since=datetime.utcnow(), stale_reason=reason)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if marked:
+        logger.info(f"Marked {marked} documents of form ID {form_id} stale: {reason}")
+    return marked
+
+
+def forget_entities(entity_ids):
+    """Drops the document rows of deleted entities."""
+    for chunk in _chunks(entity_ids):
+        db.session.execute(
+            db.delete(GeneratedDocument).where(GeneratedDocument.entity_id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def forget_form(form_id):
+    """Drops the document rows of a deleted form (SQLite does not enforce the cascade)."""
+    db.session.execute(
+        db.delete(GeneratedDocument).where(GeneratedDocument.form_id == form_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def stale_documents(form_id=None, entity_id=None, after=0, limit=None):
+    """Stale documents in id order, optionally of one form or entity, starting after id `after`."""
+    query = GeneratedDocument.query.filter(GeneratedDocument.stale.is_(True), GeneratedDocument.id > after)
+    if form_id is not None:
+        query = query.filter(GeneratedDocument.form_id == form_id)
+    if entity_id is not None:
+        query = query.filter(GeneratedDocument.entity_id == entity_id)
+    query = query.order_by(GeneratedDocument.id)
+    return query.limit(limit).all() if limit else query.all()
+
+
+def stale_pairs(form_id=None):
+    """
+    {form id: [entity ids]} of the stale documents that no queued or running
+    job is about to regenerate, for queuing regeneration.
+    """
+    pending = db.select(GenerationJobItem.id).join(GenerationJob).where(
+        GenerationJob.status.in_(('queued', 'running')),
+        GenerationJob.form_id == GeneratedDocument.form_id,
+        GenerationJobItem.status == 'pending',
+        GenerationJobItem.entity_id == GeneratedDocument.entity_id
+    )
+    query = db.select(GeneratedDocument.form_id, GeneratedDocument.entity_id) \
+        .where(GeneratedDocument.stale.is_(True), ~pending.exists()) \
+        .order_by(GeneratedDocument.form_id, GeneratedDocument.entity_id)
+    if form_id is not None:
+        query = query.where(GeneratedDocument.form_id == form_id)
+    pairs = {}
+    for row in db.session.execute(query):
+        pairs.setdefault(row.form_id, []).append(row.entity_id)
+    return pairs
@@ -0,0 +1,172 @@
+"""
+Streaming bulk import of entities from CSV or NDJSON.
+
+Rows are read one at a time, validated with Entity.validate and inserted in
+batches: through COPY on Postgres (psycopg2 or psycopg 3), with an executemany
+INSERT elsewhere. Each batch is committed on its own, so a bad row or batch
+never aborts the whole load, and memory stays bounded by one batch.
+"""
+import io
+import csv
+import json
+import logging
+from datetime import datetime
+from .models import db, Entity, TableVersion, ENTITY_FIELDS
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+# Errors kept in the report; the counters still cover every row
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+# Columns written by the import; the ORM defaults are filled in by hand since COPY skips them
+_COLUMNS = ENTITY_FIELDS + ['version', 'created_at', 'updated_at']
+
+
+def detect_format(requested, filename, content_type):
+    """Picks the import format from an explicit choice, the file extension or the content type."""
+    if requested:
+        if requested not in IMPORT_FORMATS:
+            raise ValueError(f"Invalid format '{requested}'. Allowed: {', '.join(IMPORT_FORMATS)}")
+        return requested
+    filename = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    if filename.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    raise ValueError('Could not tell the file format; pass format=csv or format=ndjson')
+
+
+def read_rows(stream, file_format):
+    """
+    Yields (line number, row dict or None, parse error or None) from a binary stream.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        try:
+            reader.fieldnames
+        except csv.Error as e:
+            raise ValueError(f'Invalid CSV header: {e}')
+        if not reader.fieldnames or 'name' not in reader.fieldnames:
+            raise ValueError("CSV header must include a 'name' column")
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                # The bad line is consumed and reading carries on with the next one;
+                # DictReader only copies line_num after a successful read
+                yield reader.reader.line_num, None, f'Invalid CSV: {e}'
+                continue
+            if None in row:
+                yield reader.line_num, None, 'Row has more values than the header'
+                continue
+            yield reader.line_num, row, None
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line), None
+            except ValueError as e:
+                yield line_number, None, f'Invalid JSON: {e}'
+
+
+def _copy_rows(rows):
+    """Inserts rows with COPY through the session's connection. Returns False if the driver has no COPY."""
+    connection = db.session.connection()
+    driver = connection.dialect.driver
+    if connection.dialect.name != 'postgresql' or driver not in ('psycopg2', 'psycopg'):
+        return False
+
+    copy_sql = f"COPY {Entity.__tablename__} ({', '.join(_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    dbapi_connection = connection.connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        if driver == 'psycopg2':
+            # Unquoted empty fields are NULL in COPY's csv format; validated rows never hold ''
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            for row in rows:
+                writer.writerow([row[column] for column in _COLUMNS])
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+        else:
+            with cursor.copy(copy_sql.replace(' WITH (FORMAT csv)', '')) as copy:
+                for row in rows:
+                    copy.write_row([row[column] for column in _COLUMNS])
+    return True
+
+
+def _insert_batch(rows):
+    """Inserts one batch in its own transaction."""
+    if not _copy_rows(rows):
+        db.session.execute(db.insert(Entity), rows)
+    TableVersion.bump('entities')
+    db.session.commit()
+
+
+def import_entities(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Validates and inserts rows from read_rows. Returns a report:
+    {"inserted": n, "failed": n, "errors": [{"line": n, "error": "..."}], "errors_truncated": bool}
+    plus "aborted" if the file could not be read to the end.
+    Raises ValueError if the file is unusable from the start (e.g. a CSV without a name column).
+    """
+    report = {'inserted': 0, 'failed': 0, 'errors': [], 'errors_truncated': False}
+
+    def fail(line_number, error):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_number, 'error': error})
+        else:
+            report['errors_truncated'] = True
+
+    def flush(batch):
+        try:
+            _insert_batch([row for _, row in batch])
+            report['inserted'] += len(batch)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Import batch of {len(batch)} rows failed, retrying row by row: {e}")
+            # Find the offending rows; everything else still gets in
+            for line_number, row in batch:
+                try:
+                    db.session.execute(db.insert(Entity), [row])
+                    TableVersion.bump('entities')
+                    db.session.commit()
+                    report['inserted'] += 1
+                except Exception as row_error:
+                    db.session.rollback()
+                    fail(line_number, str(row_error.__cause__ or row_error).splitlines()[0])
+
+    batch = []
+    try:
+        for line_number, data, error in rows:
+            if error is None:
+                try:
+                    values = Entity.validate(data)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                fail(line_number, error)
+                continue
+            now = datetime.utcnow()
+            values.update(version=1, created_at=now, updated_at=now)
+            batch.append((line_number, values))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    except UnicodeDecodeError as e:
+        # Rows read so far are still imported
+        report['aborted'] = f'Stopped reading: the file is not valid UTF-8 ({e.reason})'
+    if batch:
+        flush(batch)
+
+    logger.info(f"Entity import finished: {report['inserted']} inserted, {report['failed']} failed")
+    return report
@@ -0,0 +1,169 @@
+"""
+Compiled fill plans: for a (form, mapping version), which widget annotations
+belong to the mapped PDF fields, grouped by page. Filling then only touches
+those widgets, each with just its own values.
+
+Plans are compiled from the widget positions stored in the field catalog, so
+compiling never needs the parsed template.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from .models import db, FieldMapping, PdfFormField
+from .blob_store import ensure_catalog
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Plans are small; keep plenty of them
+DEFAULT_MAX_PLANS = 512
+
+
+class FillPlan:
+    """
+    A compiled plan for filling one form.
+    `mappings` is a tuple of (pdf field, entity field); `pages` is a tuple of
+    (page index, widgets), widgets being a tuple of (position in the page's
+    /Annots, tuple of the pdf field names that widget shows). `has_fields`
+    is False for a template without any fillable fields.
+    Plain tuples, so plans can be sent to fill pool workers.
+    """
+
+    def __init__(self, version, mappings, pages, has_fields=True):
+        self.version = version
+        self.mappings = mappings
+        self.pages = pages
+        self.has_fields = has_fields
+
+    def fill_data(self, entity):
+        """Builds the {pdf field: string value} dictionary for an entity."""
+        fill_data = {}
+        missing = []
+        for pdf_field, entity_field in self.mappings:
+            value = entity.get_field(entity_field)
+            if value is not None:
+                fill_data[pdf_field] = str(value)
+            else:
+                missing.append(entity_field)
+        if missing:
+            logger.debug(f"Entity {entity.id} has no value for mapped fields: {missing}")
+        return fill_data
+
+
+def compile_plan(form_id, catalog, mappings, version):
+    """
+    Collects the widgets of the mapped fields by page, from the form's
+    `catalog` rows of (qualified name, widget positions). A mapping
+    matches a field by qualified name or by the field's own /T (the last name
+    part), as pypdf does when filling.
+    """
+    wanted = {mapping.pdf_field_name for mapping in mappings}
+    by_page = {}
+    found = set()
+    has_fields = False
+    for name, widgets in catalog:
+        has_fields = True
+        matched = {name, name.rsplit('.', 1)[-1]} & wanted
+        if not matched:
+            continue
+        for page_index, annot_index in widgets or ():
+            by_page.setdefault(page_index, {}).setdefault(annot_index, set()).update(matched)
+            found.update(matched)
+
+    if wanted - found:
+        logger.warning(f"Mapped fields without widgets in form ID {form_id}: {sorted(wanted - found)}")
+    return FillPlan(
+        version,
+        tuple((mapping.pdf_field_name, mapping.entity_field_name) for mapping in mappings),
+        tuple(
+            (page_index, tuple((annot_index, tuple(sorted(names))) for annot_index, names in sorted(widgets.items())))
+            for page_index, widgets in sorted(by_page.items())
+        ),
+        has_fields
+    )
+
+
+def _catalogs(form_ids):
+    """{form id: [(field name, widget positions)]} in one query."""
+    catalogs = {form_id: [] for form_id in form_ids}
+    rows = db.session.execute(
+        db.select(PdfFormField.form_id, PdfFormField.name, PdfFormField.widgets)
+        .where(PdfFormField.form_id.in_(catalogs))
+    )
+    for row in rows:
+        catalogs[row.form_id].append((row.name, row.widgets))
+    return catalogs
+
+
+class FillPlanCache:
+    """
+    Per-process cache of compiled plans, keyed by (form id, template hash).
+    A plan is rebuilt when the form's mapping_version moves past it.
+    """
+
+    def __init__(self, max_plans=DEFAULT_MAX_PLANS):
+        self.max_plans = max_plans
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, form):
+        """Returns the current plan for a form, compiling it if needed."""
+        key = (form.id, form.file_hash)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None and plan.version == form.mapping_version:
+                self._plans.move_to_end(key)
+                return plan
+
+        mappings = FieldMapping.query.filter_by(form_id=form.id).order_by(FieldMapping.id).all()
+        if mappings:
+            ensure_catalog(form)
+        return self._compile(form, mappings, _catalogs([form.id])[form.id] if mappings else ())
+
+    def _compile(self, form, mappings, catalog):
+        key = (form.id, form.file_hash)
+        if mappings:
+            plan = compile_plan(form.id, catalog, mappings, form.mapping_version)
+        else:
+            # Nothing to fill, no need to touch the template
+            plan = FillPlan(form.mapping_version, (), ())
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        logger.info(f"Compiled fill plan v{plan.version} for form ID {form.id}: "
+                    f"{len(plan.mappings)} mappings on {len(plan.pages)} pages")
+        return plan
+
+    def get_many(self, forms):
+        """Returns the current plans for several forms, loading all missing mappings and catalogs in one query each."""
+        plans = {}
+        with self._lock:
+            for form in forms:
+                plan = self._plans.get((form.id, form.file_hash))
+                if plan is not None and plan.version == form.mapping_version:
+                    self._plans.move_to_end((form.id, form.file_hash))
+                    plans[form.id] = plan
+        missing = [form for form in forms if form.id not in plans]
+        if missing:
+            by_form = {form.id: [] for form in missing}
+            for mapping in FieldMapping.query.filter(FieldMapping.form_id.in_(by_form)).order_by(FieldMapping.id):
+                by_form[mapping.form_id].append(mapping)
+            mapped = [form for form in missing if by_form[form.id]]
+            for form in mapped:
+                ensure_catalog(form)
+            catalogs = _catalogs([form.id for form in mapped])
+            for form in missing:
+                plans[form.id] = self._compile(form, by_form[form.id], catalogs.get(form.id, ()))
+        return [plans[form.id] for form in forms]
+
+    def invalidate(self, form_id):
+        """Drops the plans for a form."""
+        with self._lock:
+            for key in [k for k in self._plans if k[0] == form_id]:
+                del self._plans[key]
+
+
+# Shared, process-wide plan cache
+fill_plans = FillPlanCache()
@@ -0,0 +1,350 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait as wait_futures, TimeoutError as FutureTimeoutError
+from .filling import fill_batch, fill_reader, warm_worker
+from .metrics import metrics
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Per server process: gunicorn's WEB_CONCURRENCY workers share the cores instead of each taking all of them
+DEFAULT_WORKERS = max((os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY') or 1), 1)
+DEFAULT_BATCH_SIZE = 25
+# Seconds a single-document fill may take, queueing included
+DEFAULT_TIMEOUT = 30
+# Seconds a single-document request waits for a free slot before being turned away
+DEFAULT_QUEUE_WAIT = 1
+# Seconds suggested to clients in Retry-After when the pool is saturated
+DEFAULT_RETRY_AFTER = 5
+# Template bytes are handed to workers as files named by content hash
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), 'tax_form_app_templates')
+
+
+class PoolSaturated(Exception):
+    """Raised when no fill slot frees up in time; answered with 503 and Retry-After."""
+
+    def __init__(self, message, retry_after=DEFAULT_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FillTimeout(Exception):
+    """Raised when a single-document fill does not finish within the pool's timeout."""
+
+
+class FillPool:
+    """
+    Process pool for CPU-bound PDF filling.
+    With zero workers, filling runs inline in the calling thread.
+
+    Work is admitted through two bounded queues, so PDF work can't pile up
+    without limit or starve the rest of the API:
+    - single documents (generate-pdf, packets): at most `queue_size` in flight;
+      a request that can't get a slot within `queue_wait` seconds gets PoolSaturated.
+      A packet is admitted as one unit: it takes one slot plus whichever others
+      are free (up to one per form) and runs its forms through them in turn, so
+      it needs no more free capacity than a single document.
+    - batches (bulk, background jobs): at most two per worker in flight across
+      all callers; further batches wait for a slot.
+
+    A fill that times out can't be stopped once a worker has started it: the
+    caller gets FillTimeout, but the fill runs to completion and keeps both the
+    worker and its slot until then. The slot limits therefore count such fills
+    as the busy CPU they are, and a burst of timeouts turns new requests away
+    with PoolSaturated instead of queueing them behind hidden work.
+
+    Each server process runs its own pool, so a pre-fork server with N workers
+    runs N * `workers` fill processes; size `workers` so that stays near the
+    core count (the default divides the cores by WEB_CONCURRENCY).
+
+    Workers never receive template bytes through the task queue. Each template
+    is written once to `spool_dir` under its content hash; tasks carry only the
+    hash and path, and a worker reads the file when it first sees the hash.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, queue_size=None,
+                 timeout=DEFAULT_TIMEOUT, queue_wait=DEFAULT_QUEUE_WAIT, retry_after=DEFAULT_RETRY_AFTER,
+                 spool_dir=DEFAULT_SPOOL_DIR):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.Condition()
+        self._in_flight = {'single': 0, 'batch': 0}
+        # (content hash, spool path) of templates every worker parses as it starts
+        self._preload = []
+        self.configure(workers, batch_size, queue_size, timeout, queue_wait, retry_after, spool_dir)
+
+    def configure(self, workers, batch_size, queue_size=None, timeout=DEFAULT_TIMEOUT,
+                  queue_wait=DEFAULT_QUEUE_WAIT, retry_after=DEFAULT_RETRY_AFTER, spool_dir=DEFAULT_SPOOL_DIR):
+        """Sets the pool size, batch size and admission limits; a running pool is restarted lazily."""
+        self.shutdown()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size or max(workers, 1) * 4
+        self.timeout = timeout
+        self.queue_wait = queue_wait
+        self.retry_after = retry_after
+        self.spool_dir = spool_dir
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn keeps DB connections and held locks out of the workers
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=warm_worker if self._preload else None,
+                    initargs=(tuple(self._preload),) if self._preload else ()
+                )
+                logger.info(f"Started PDF fill pool with {self.workers} workers")
+            return self._executor
+
+    def start(self):
+        """
+        Spawns every worker process now rather than on first use, e.g. from a
+        server's post-fork hook, so preloaded templates are parsed before the first fill.
+        """
+        if self.workers <= 0:
+            return
+        executor = self._get_executor()
+        # Each submit while no worker is idle spawns another process
+        for _ in range(self.workers):
+            executor.submit(os.getpid)
+
+    def shutdown(self, wait=False):
+        """Stops the worker processes, if any; with `wait`, returns once they have exited."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+    # --- Template spool ---
+    def _spool(self, template):
+        """Returns the path of the template's bytes in the spool directory, writing them on first use."""
+        path = os.path.join(self.spool_dir, f"{template.content_hash}.pdf")
+        if not os.path.exists(path):
+            os.makedirs(self.spool_dir, exist_ok=True)
+            # Write then rename, so workers never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(template.file_data)
+            os.replace(tmp_path, path)
+            logger.debug(f"Spooled template {template.content_hash[:12]} for the fill pool")
+        return path
+
+    def preload(self, template):
+        """Has each worker process parse `template` when it starts (see warmup)."""
+        entry = (template.content_hash, self._spool(template))
+        if entry not in self._preload:
+            self._preload.append(entry)
+
+    def discard_template(self, content_hash):
+        """Removes a template's spool file once its bytes are deleted."""
+        try:
+            os.remove(os.path.join(self.spool_dir, f"{content_hash}.pdf"))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove spooled template {content_hash[:12]}: {e}")
+
+    # --- Admission ---
+    def _limit(self, kind):
+        return self.queue_size if kind == 'single' else max(self.workers, 1) * 2
+
+    def _acquire(self, kind, wait, count=1):
+        """
+        Takes a slot, waiting up to `wait` seconds (None waits indefinitely), plus
+        up to `count` - 1 more if they are free. Returns the number taken.
+        """
+        with self._slots:
+            if not self._slots.wait_for(lambda: self._in_flight[kind] < self._limit(kind), timeout=wait):
+                metrics.count_rejection(kind)
+                raise PoolSaturated(
+                    f"PDF generation is at capacity ({self._limit(kind)} {kind} fills in flight)", self.retry_after
+                )
+            taken = min(count, self._limit(kind) - self._in_flight[kind])
+            self._in_flight[kind] += taken
+            return taken
+
+    def _release(self, kind, count=1):
+        with self._slots:
+            self._in_flight[kind] -= count
+            self._slots.notify_all()
+
+    def _submit(self, kind, template, items, pages, mode, release=True):
+        """
+        Submits one fill_batch call. With `release`, it holds a `kind` slot until
+        it is done or cancelled; otherwise the caller manages the slot.
+        """
+        metrics.count_fill(kind, [fill_data for _, fill_data in items])
+        timed = metrics.enabled
+        try:
+            future = self._get_executor().submit(
+                fill_batch, template.content_hash, self._spool(template), items, pages, mode, timed
+            )
+        except Exception:
+            if release:
+                self._release(kind)
+            raise
+        future.timed = timed
+        if release:
+            future.add_done_callback(lambda _: self._release(kind))
+        return future
+
+    def _results(self, future, timeout=None):
+        """Waits for a fill_batch future and returns its results, recording the worker's stage timings."""
+        results = future.result(timeout=timeout)
+        if future.timed:
+            results, timings = results
+            metrics.record_stages(timings)
+        return results
+
+    def saturated(self, kind='batch'):
+        """True if every slot of `kind` is taken, for turning requests away before they start."""
+        with self._slots:
+            return self._in_flight[kind] >= self._limit(kind)
+
+    def stats(self):
+        """Returns slot usage, for sizing FILL_POOL_WORKERS and FILL_QUEUE_SIZE."""
+        with self._slots:
+            return {
+                'workers': self.workers,
+                'single_in_flight': self._in_flight['single'],
+                'single_limit': self._limit('single'),
+                'batch_in_flight': self._in_flight['batch'],
+                'batch_limit': self._limit('batch'),
+                'timeout_seconds': self.timeout
+            }
+
+    # --- Filling ---
+    def batches(self, items):
+        """Splits an iterable of (filename, fill_data) into lists of batch_size."""
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def fill_one(self, template, fill_data, pages=None, mode='full'):
+        """
+        Fills one document off the request thread and returns the PDF bytes.
+        Raises PoolSaturated if no slot frees up in time, FillTimeout if filling takes too long.
+        """
+        self._acquire('single', self.queue_wait)
+        if self.workers <= 0:
+            metrics.count_fill('single', [fill_data])
+            timings = {} if metrics.enabled else None
+            try:
+                return fill_reader(template.reader, fill_data, lock=template.lock, pages=pages, mode=mode, timings=timings)
+            finally:
+                self._release('single')
+                metrics.record_stages(timings)
+
+        future = self._submit('single', template, [('', fill_data)], pages, mode)
+        try:
+            with metrics.stage('fill_pool'):
+                _, pdf_bytes, error = self._results(future, self.timeout)[0]
+        except FutureTimeoutError:
+            # Only drops a fill that hasn't started; a running one keeps its slot until it finishes
+            future.cancel()
+            metrics.count_timeout()
+            raise FillTimeout(f"PDF generation did not finish within {self.timeout} seconds")
+        if error:
+            raise RuntimeError(error)
+        return pdf_bytes
+
+    def fill_many(self, template, items, pages=None, mode='full'):
+        """
+        Fills a parsed template for every (filename, fill_data) in `items`,
+        visiting only the plan `pages` when given, in output `mode`.
+        Yields (filename, pdf bytes or None, error or None) in input order,
+        waiting for batch slots as needed.
+        """
+        if self.workers <= 0:
+            for filename, fill_data in items:
+                metrics.count_fill('batch', [fill_data])
+                timings = {} if metrics.enabled else None
+                try:
+                    pdf_bytes = fill_reader(template.reader, fill_data, lock=template.lock, pages=pages, mode=mode, timings=timings)
+                    metrics.record_stages(timings)
+                    yield filename, pdf_bytes, None
+                except Exception as e:
+                    logger.error(f"Error filling {filename}: {e}", exc_info=True)
+                    yield filename, None, str(e)
+            return
+
+        pending = deque()
+        try:
+            for batch in self.batches(items):
+                # Hand back finished work rather than just waiting for a slot
+                while pending and self.saturated('batch'):
+                    yield from self._results(pending.popleft())
+                self._acquire('batch', None)
+                pending.append(self._submit('batch', template, batch, pages, mode))
+            while pending:
+                yield from self._results(pending.popleft())
+        finally:
+            # Client went away mid-stream: drop work nobody will read
+            for future in pending:
+                future.cancel()
+
+    def fill_each(self, requests):
+        """
+        Fills one document per (template, filename, fill_data, pages, mode) request,
+        as one admission (e.g. the forms of a packet): as many run at once as it
+        got slots, the rest as those finish, all within one `timeout`.
+        Returns a list of (filename, pdf bytes or None, error or None) in input order.
+        Raises PoolSaturated or FillTimeout like fill_one.
+        """
+        if self.workers <= 0:
+            results = []
+            for template, filename, fill_data, pages, mode in requests:
+                try:
+                    results.append((filename, self.fill_one(template, fill_data, pages, mode), None))
+                except (PoolSaturated, FillTimeout):
+                    raise
+                except Exception as e:
+                    logger.error(f"Error filling {filename}: {e}", exc_info=True)
+                    results.append((filename, None, str(e)))
+            return results
+
+        requests = list(requests)
+        if not requests:
+            return []
+        slots = self._acquire('single', self.queue_wait, len(requests))
+        deadline = time.monotonic() + self.timeout
+        waiting = deque(enumerate(requests))
+        running = {}
+        results = [None] * len(requests)
+        try:
+            with metrics.stage('fill_pool'):
+                while waiting or running:
+                    while waiting and len(running) < slots:
+                        index, (template, filename, fill_data, pages, mode) = waiting.popleft()
+                        future = self._submit('single', template, [(filename, fill_data)], pages, mode, release=False)
+                        running[future] = index
+                    done, _ = wait_futures(running, timeout=max(deadline - time.monotonic(), 0),
+                                           return_when=FIRST_COMPLETED)
+                    if not done:
+                        metrics.count_timeout()
+                        raise FillTimeout(f"PDF generation did not finish within {self.timeout} seconds")
+                    for future in done:
+                        results[running.pop(future)] = self._results(future)[0]
+            return results
+        finally:
+            # Fills that already started keep their slot until they finish, like in fill_one
+            started = [future for future in running if not future.cancel() and not future.done()]
+            self._release('single', slots - len(started))
+            for future in started:
+                future.add_done_callback(lambda _: self._release('single'))
+
+
+# Shared, process-wide pool (configured in create_app)
+fill_pool = FillPool()
@@ -0,0 +1,200 @@
+"""
+PDF filling logic shared by the single, bulk and background generation paths.
+Everything here is free of Flask and database state so it can run inside
+worker processes; output is byte-identical whichever path produced it.
+pypdf is imported on first use, so processes that never fill (e.g. the
+migration CLI) don't pay for it.
+"""
+import io
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Parsed templates kept per worker process
+_WORKER_READER_LIMIT = 8
+_worker_readers = OrderedDict()
+_worker_lock = threading.Lock()
+
+# 'full' rewrites the whole document; 'incremental' appends only the changed objects
+OUTPUT_MODES = ('full', 'incremental')
+
+
+def output_filename(entity_name, form_name):
+    """Creates a meaningful filename for a filled PDF."""
+    return f"{entity_name.replace(' ', '_')}_{form_name.replace(' ', '_')}.pdf"
+
+
+def resolve_output_mode(requested, form_mode):
+    """Picks the request's output mode, falling back to the form's; raises ValueError if unknown."""
+    mode = requested or form_mode or 'full'
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Invalid output_mode '{mode}'. Allowed: {', '.join(OUTPUT_MODES)}")
+    return mode
+
+
+class _Stopwatch:
+    """Appends the seconds spent in a block to timings[stage]."""
+
+    __slots__ = ('_timings', '_stage', '_started')
+
+    def __init__(self, timings, stage):
+        self._timings = timings
+        self._stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._timings.setdefault(self._stage, []).append(time.perf_counter() - self._started)
+        return False
+
+
+def _timed(timings, stage):
+    return nullcontext() if timings is None else _Stopwatch(timings, stage)
+
+
+def fill_reader(reader, fill_data, lock=None, pages=None, mode='full', timings=None):
+    """
+    Fills a parsed template with field values and returns the PDF bytes.
+    `lock` guards the reader when it is shared (see ParsedTemplate).
+    `pages` is a fill plan's pages tuple; with one only the planned widgets are filled,
+    without one every widget of every page is matched against `fill_data`.
+    `mode` 'incremental' keeps the template bytes as they are and appends an update section
+    holding only the filled widgets and their appearance streams; it leaves the AcroForm
+    (and with it the /Fields array) untouched, so NeedAppearances is not set.
+    `timings`, if given, is a dict that collects {stage: [seconds, ...]} for clone, fill_fields and write.
+    """
+    from pypdf import PdfWriter
+    if mode == 'incremental':
+        # The incremental writer copies the template stream while writing, so hold the lock throughout
+        with lock or nullcontext():
+            with _timed(timings, 'clone'):
+                writer = PdfWriter(reader, incremental=True)
+            with _timed(timings, 'fill_fields'):
+                _apply_values(writer, fill_data, pages, need_appearances=None)
+            with _timed(timings, 'write'):
+                return _write(writer)
+
+    writer = PdfWriter()
+
+    # Clone the entire document from the reader, including form fields
+    with lock or nullcontext(), _timed(timings, 'clone'):
+        writer.clone_document_from_reader(reader)
+    writer.set_need_appearances_writer(True)
+    with _timed(timings, 'fill_fields'):
+        _apply_values(writer, fill_data, pages)
+    with _timed(timings, 'write'):
+        return _write(writer)
+
+
+def _apply_values(writer, fill_data, pages, need_appearances=True):
+    """
+    Sets the field values on the writer's pages. `need_appearances` is passed to
+    pypdf as auto_regenerate; None leaves the AcroForm's NeedAppearances as it is.
+    """
+    # Apply the field values - PyPDF library will handle this
+    if fill_data and pages is not None:
+        # Only the planned widgets, each with just its own values
+        for page_index, widgets in pages:
+            try:
+                _fill_widgets(writer, writer.pages[page_index], widgets, fill_data, need_appearances)
+            except Exception as page_error:
+                logger.warning(f"Could not fill fields on page {page_index+1}: {page_error}")
+    elif fill_data:
+        # The writer now has the AcroForm, so this will work
+        writer.update_page_form_field_values(writer.pages[0], fill_data, auto_regenerate=need_appearances)
+
+        # For multi-page forms, try to apply to all pages
+        for i in range(1, len(writer.pages)):
+            try:
+                writer.update_page_form_field_values(writer.pages[i], fill_data, auto_regenerate=need_appearances)
+            except Exception as page_error:
+                logger.warning(f"Could not fill fields on page {i+1}: {page_error}")
+
+
+def _fill_widgets(writer, page, widgets, fill_data, need_appearances=True):
+    """
+    Fills the planned `widgets` of one page. pypdf fills whole pages only, so
+    the page's /Annots is narrowed to those widgets for the call and put back
+    afterwards; the other annotations are never matched against the values.
+    """
+    from pypdf.generic import ArrayObject, NameObject
+    annots = page.raw_get('/Annots')
+    all_annots = annots.get_object()
+    targets = ArrayObject()
+    values = {}
+    for annot_index, names in widgets:
+        widget_values = {name: fill_data[name] for name in names if name in fill_data}
+        if widget_values:
+            targets.append(all_annots[annot_index])
+            values.update(widget_values)
+    if not targets:
+        return
+    page[NameObject('/Annots')] = targets
+    try:
+        writer.update_page_form_field_values(page, values, auto_regenerate=need_appearances)
+    finally:
+        page[NameObject('/Annots')] = annots
+
+
+def _write(writer):
+    # Save the filled PDF to a new in-memory stream
+    output_stream = io.BytesIO()
+    writer.write(output_stream)
+    return output_stream.getvalue()
+
+
+def _worker_reader(content_hash, template_path, timings=None):
+    """Returns this process's parsed reader for a template, reading and parsing its spool file on first use."""
+    with _worker_lock:
+        reader = _worker_readers.get(content_hash)
+        if reader is not None:
+            _worker_readers.move_to_end(content_hash)
+            return reader
+        from pypdf import PdfReader
+        with _timed(timings, 'worker_parse'):
+            with open(template_path, 'rb') as f:
+                reader = PdfReader(io.BytesIO(f.read()))
+        _worker_readers[content_hash] = reader
+        while len(_worker_readers) > _WORKER_READER_LIMIT:
+            _worker_readers.popitem(last=False)
+        return reader
+
+
+def warm_worker(templates):
+    """
+    Pool process initializer: parses the given (content hash, template path)
+    templates, most used first, and resolves their objects with a throwaway fill.
+    """
+    for content_hash, template_path in reversed(templates[:_WORKER_READER_LIMIT]):
+        try:
+            reader = _worker_reader(content_hash, template_path)
+            fill_reader(reader, {}, lock=_worker_lock)
+        except Exception as e:
+            logger.warning(f"Could not warm template {content_hash[:12]}: {e}")
+
+
+def fill_batch(content_hash, template_path, items, pages=None, mode='full', timed=False):
+    """
+    Fills one template for a batch of entities. Runs in pool worker processes.
+    The template is read from `template_path` only if this process hasn't parsed `content_hash` yet.
+    `items` is a list of (filename, fill_data); returns a list of
+    (filename, pdf bytes or None, error message or None).
+    With `timed`, returns (results, {stage: [seconds, ...]}) instead.
+    """
+    timings = {} if timed else None
+    reader = _worker_reader(content_hash, template_path, timings)
+    results = []
+    for filename, fill_data in items:
+        try:
+            pdf_bytes = fill_reader(reader, fill_data, lock=_worker_lock, pages=pages, mode=mode, timings=timings)
+            results.append((filename, pdf_bytes, None))
+        except Exception as e:
+            logger.error(f"Error filling {filename}: {e}", exc_info=True)
+            results.append((filename, None, str(e)))
+    return (results, timings) if timed else results
@@ -0,0 +1,101 @@
+"""
+Conditional GETs and response compression for the JSON read endpoints.
+
+Read endpoints compute a cheap version stamp first (a table's change counter
+from table_versions, or a form's mapping_version). The stamp is
+hashed into a weak ETag, and a matching If-None-Match is answered with 304
+before the main query runs or anything is serialized. Responses carry
+Cache-Control: no-cache, so the frontend's polling always revalidates.
+
+Large JSON bodies are compressed with Brotli when the brotli package is
+installed and the client accepts it, otherwise with gzip.
+"""
+import gzip
+import hashlib
+import logging
+from datetime import timezone
+from flask import request, jsonify, Response
+
+try:
+    import brotli
+except ImportError: # optional; gzip only
+    brotli = None
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# JSON bodies below this size are sent as they are
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv')
+
+
+def make_etag(*parts):
+    """Hashes version stamp parts (plus the query string, for lists) into an ETag value."""
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _utc(moment):
+    return moment.replace(tzinfo=timezone.utc, microsecond=0) if moment is not None else None
+
+
+def not_modified(etag):
+    """
+    True if the client's copy is current, by If-None-Match only. If-Modified-Since
+    is not honoured: HTTP dates have one-second resolution, so two edits within
+    a second would leave a client that revalidated between them with the first.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return False
+
+
+def cached_json(build, etag, last_modified=None):
+    """
+    Returns a 304 if the client's copy is current, otherwise jsonify(build())
+    with the ETag and (informational) Last-Modified headers. `build` is only called on a miss.
+    """
+    if not_modified(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = _utc(last_modified)
+    response.cache_control.no_cache = True
+    return response
+
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def init_app(app):
+    """Compresses large, buffered JSON/NDJSON/CSV responses for clients that accept it."""
+    min_bytes = app.config.get('COMPRESS_MIN_BYTES', DEFAULT_COMPRESS_MIN_BYTES)
+    if min_bytes < 0:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.content_length is None or response.content_length < min_bytes:
+            return response
+        encoding = _accepted_encoding()
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=5))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = encoding
+        return response
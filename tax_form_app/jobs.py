@@ -0,0 +1,139 @@
+import logging
+from flask import request, jsonify, Blueprint, Response, stream_with_context
+from .models import db, Entity, PdfForm, FieldMapping, GenerationJob, GenerationJobItem
+from .zip_stream import stream_zip
+from .filling import resolve_output_mode
+
+# Blueprint for background generation jobs, e.g. '/api/jobs/<id>'
+jobs = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Default number of results per download chunk
+DEFAULT_RESULTS_LIMIT = 500
+
+def queue_job(form_id, entity_ids, output_mode=None):
+    """Adds a queued job and its items in the caller's transaction; returns the job."""
+    job = GenerationJob(form_id=form_id, status='queued', total=len(entity_ids), output_mode=output_mode)
+    db.session.add(job)
+    db.session.flush()
+    # One executemany insert for all the job's items
+    db.session.execute(
+        db.insert(GenerationJobItem),
+        [{'job_id': job.id, 'entity_id': entity_id, 'status': 'pending'} for entity_id in entity_ids]
+    )
+    return job
+
+@jobs.route('', methods=['POST'])
+def submit_job():
+    """
+    Queues a generation job for one form and many entities.
+    Takes the same body as /api/generate-pdf/bulk and returns the job for polling.
+    """
+    data = request.json
+    if not data or 'form_id' not in data or ('entity_ids' not in data and 'filter' not in data):
+        return jsonify({'error': 'Invalid data. Required: form_id and entity_ids or filter'}), 400
+
+    form_id = data.get('form_id')
+    form = db.session.get(PdfForm, form_id)
+    if not form:
+        return jsonify({'error': 'Form not found'}), 404
+    if not FieldMapping.query.filter_by(form_id=form_id).first():
+        return jsonify({'error': 'No mappings found for this form. Please configure field mappings first.'}), 400
+
+    try:
+        # Checked now so a bad mode fails the request, not the job
+        resolve_output_mode(data.get('output_mode'), form.output_mode)
+        entity_ids = [row.id for row in Entity.matching(data.get('entity_ids'), data.get('filter')).with_entities(Entity.id)]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not entity_ids:
+        return jsonify({'error': 'No matching entities found'}), 404
+
+    try:
+        job = queue_job(form_id, entity_ids, data.get('output_mode'))
+        db.session.commit()
+        logger.info(f"Queued job ID {job.id}: {len(entity_ids)} entities for form ID {form_id}")
+        return jsonify(job.to_dict()), 202
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error queuing job: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to queue job: {str(e)}'}), 500
+
+@jobs.route('/<int:id>', methods=['GET'])
+def get_job(id):
+    """Reports a job's progress, throughput and (the first) failures."""
+    job = db.session.get(GenerationJob, id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    failures = GenerationJobItem.query.filter_by(job_id=id, status='failed') \
+        .order_by(GenerationJobItem.id).limit(request.args.get('failures', 50, type=int)).all()
+    result = job.to_dict()
+    result['failures'] = [item.to_dict() for item in failures]
+    return jsonify(result), 200
+
+@jobs.route('/<int:id>/results', methods=['GET'])
+def download_job_results(id):
+    """
+    Streams finished PDFs of a job as a ZIP, one chunk at a time.
+    Pass ?after=<X-Next-After of the previous chunk>&limit=N to page through the results.
+    """
+    job = db.session.get(GenerationJob, id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', DEFAULT_RESULTS_LIMIT, type=int), DEFAULT_RESULTS_LIMIT * 10)
+
+    item_ids = db.session.execute(
+        db.select(GenerationJobItem.id)
+        .where(GenerationJobItem.job_id == id, GenerationJobItem.status == 'done', GenerationJobItem.id > after)
+        .order_by(GenerationJobItem.id).limit(limit)
+    ).scalars().all()
+    if not item_ids:
+        return jsonify({'error': 'No more results available', 'job': job.to_dict()}), 404
+
+    def files():
+        # Read one PDF at a time so memory stays bounded by the largest result
+        for item_id in item_ids:
+            item = db.session.execute(
+                db.select(GenerationJobItem.filename, GenerationJobItem.output).where(GenerationJobItem.id == item_id)
+            ).one()
+            yield item.filename, item.output
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="job_{id}_{item_ids[0]}-{item_ids[-1]}.zip"',
+        'X-Next-After': str(item_ids[-1]),
+        'Access-Control-Expose-Headers': 'X-Next-After'
+    }
+    return Response(stream_with_context(stream_zip(files())), mimetype='application/zip', headers=headers)
+
+@jobs.route('/<int:id>/cancel', methods=['POST'])
+def cancel_job(id):
+    """Cancels a queued or running job; finished results stay downloadable."""
+    job = db.session.get(GenerationJob, id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status not in ('queued', 'running'):
+        return jsonify({'error': f'Job is already {job.status}'}), 409
+    job.status = 'cancelled'
+    db.session.commit()
+    return jsonify(job.to_dict()), 200
+
+@jobs.route('/<int:id>', methods=['DELETE'])
+def delete_job(id):
+    """Deletes a job and its stored results."""
+    job = db.session.get(GenerationJob, id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    try:
+        GenerationJobItem.query.filter_by(job_id=id).delete()
+        db.session.delete(job)
+        db.session.commit()
+        return jsonify({'message': 'Job deleted successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error deleting job ID {id}: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to delete job: {str(e)}'}), 500
@@ -0,0 +1,291 @@
+"""
+Request timing and Prometheus metrics.
+
+Each request collects per-stage timings (database queries, template read and
+parse, the fill stages, the pool round trip) that are sent back in a
+Server-Timing header and folded into histograms served at /metrics in the
+Prometheus text format. Counters and histograms live in this process only;
+with several server processes, scrape each one.
+
+With METRICS_ENABLED off nothing is hooked in: stage() hands back a shared
+no-op context manager and counters return straight away.
+"""
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_NO_OP = nullcontext()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        # An unlabelled counter starts at zero so it is exported before its first increment
+        self._values = {} if self.labels else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {} # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labels, label_values, [('le', repr(float(bound)))])
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, label_values, [('le', '+Inf')])
+                lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {series[-2]}')
+                lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class _Stage:
+    """Times one stage into the stage histogram and the current request's Server-Timing."""
+
+    __slots__ = ('_metrics', '_name', '_started')
+
+    def __init__(self, metrics, name):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.record_stage(self._name, time.perf_counter() - self._started)
+        return False
+
+
+class Metrics:
+    """Process-wide metrics registry."""
+
+    def __init__(self):
+        self.enabled = False
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Time spent handling a request, until the response starts.',
+            ('route', 'method', 'status')
+        )
+        self.stage_seconds = Histogram(
+            'pdf_stage_duration_seconds', 'Time spent in one stage of serving a request.', ('stage',)
+        )
+        self.query_seconds = Histogram('db_query_duration_seconds', 'Time spent executing one SQL statement.')
+        self.template_bytes = Counter('template_bytes_read_total', 'Template bytes fetched from the blob store.')
+        self.fields_filled = Counter('pdf_fields_filled_total', 'Field values submitted for filling.', ('kind',))
+        self.documents_filled = Counter('pdf_documents_filled_total', 'Documents submitted for filling.', ('kind',))
+        self.pool_rejections = Counter(
+            'fill_pool_rejections_total', 'Fills turned away because every slot was taken.', ('kind',)
+        )
+        self.pool_timeouts = Counter('fill_pool_timeouts_total', 'Single-document fills that ran past the timeout.')
+
+    # --- Recording ---
+    def stage(self, name):
+        """Context manager timing one stage; a shared no-op when metrics are off."""
+        if not self.enabled:
+            return _NO_OP
+        return _Stage(self, name)
+
+    def record_stage(self, name, seconds):
+        """Records a stage timing measured elsewhere (e.g. in a fill pool worker)."""
+        if not self.enabled:
+            return
+        self.stage_seconds.observe(seconds, name)
+        if has_request_context():
+            timings = g.setdefault('stage_timings', {})
+            timings[name] = timings.get(name, 0.0) + seconds
+
+    def record_stages(self, timings):
+        """Records the {stage: [seconds, ...]} timings returned by fill_batch."""
+        for name, durations in (timings or {}).items():
+            for seconds in durations:
+                self.record_stage(name, seconds)
+
+    def count_fill(self, kind, fill_data_list):
+        """Counts documents and field values handed to the fill pool."""
+        if not self.enabled:
+            return
+        self.documents_filled.inc(len(fill_data_list), kind)
+        self.fields_filled.inc(sum(len(fill_data or {}) for fill_data in fill_data_list), kind)
+
+    def count_template_bytes(self, size):
+        if self.enabled:
+            self.template_bytes.inc(size)
+
+    def count_rejection(self, kind):
+        if self.enabled:
+            self.pool_rejections.inc(1, kind)
+
+    def count_timeout(self):
+        if self.enabled:
+            self.pool_timeouts.inc()
+
+    # --- Flask and SQLAlchemy hooks ---
+    def init_app(self, app):
+        """Hooks request timing, query timing and the /metrics endpoint into the app, if enabled."""
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._metrics_view)
+
+        # Engine-wide, so replicas and engines created later are timed too
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        logger.info("Metrics enabled: Server-Timing headers and /metrics")
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        self.request_seconds.observe(elapsed, route, request.method, str(response.status_code))
+
+        # Server-Timing durations are in milliseconds
+        entries = []
+        queries = g.get('query_count', 0)
+        if queries:
+            entries.append(f'db;dur={g.query_seconds * 1000:.1f};desc="{queries} SQL"')
+        for name, seconds in g.get('stage_timings', {}).items():
+            entries.append(f'{name};dur={seconds * 1000:.1f}')
+        entries.append(f'total;dur={elapsed * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(entries)
+        return response
+
+    def _metrics_view(self):
+        return Response('\n'.join(self.render()) + '\n', mimetype='text/plain; version=0.0.4')
+
+    # --- Exposition ---
+    def render(self):
+        """Returns the Prometheus text exposition, one line per item."""
+        lines = []
+        for metric in (self.request_seconds, self.stage_seconds, self.query_seconds, self.template_bytes,
+                       self.fields_filled, self.documents_filled, self.pool_rejections, self.pool_timeouts):
+            lines.extend(metric.render())
+        lines.extend(self._pool_lines())
+        lines.extend(self._cache_lines())
+        return lines
+
+    def _pool_lines(self):
+        from .fill_pool import fill_pool
+        stats = fill_pool.stats()
+        lines = [
+            '# HELP fill_pool_workers Worker processes in the fill pool.',
+            '# TYPE fill_pool_workers gauge',
+            f"fill_pool_workers {stats['workers']}",
+            '# HELP fill_pool_in_flight Fills currently holding a slot.',
+            '# TYPE fill_pool_in_flight gauge',
+        ]
+        for kind in ('single', 'batch'):
+            lines.append(f'fill_pool_in_flight{{kind="{kind}"}} {stats[kind + "_in_flight"]}')
+        lines += ['# HELP fill_pool_limit Slots available per kind of fill.', '# TYPE fill_pool_limit gauge']
+        for kind in ('single', 'batch'):
+            lines.append(f'fill_pool_limit{{kind="{kind}"}} {stats[kind + "_limit"]}')
+        return lines
+
+    def _cache_lines(self):
+        from .template_cache import template_cache
+        from .output_cache import output_cache
+        lines = []
+        for cache_name, stats in (('template', template_cache.stats()), ('output', output_cache.stats())):
+            for key in ('hits', 'misses', 'evictions'):
+                name = f'{cache_name}_cache_{key}_total'
+                lines += [f'# HELP {name} {cache_name.capitalize()} cache {key}.', f'# TYPE {name} counter',
+                          f'{name} {stats[key]}']
+            name = f'{cache_name}_cache_bytes'
+            lines += [f'# HELP {name} Bytes held by the {cache_name} cache.', f'# TYPE {name} gauge',
+                      f"{name} {stats['current_bytes']}"]
+        return lines
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    metrics.query_seconds.observe(elapsed)
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+        g.query_seconds = g.get('query_seconds', 0.0) + elapsed
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not run for a failed statement; drop its start time so the
+    # list does not grow on a pooled connection or pair up with the next statement
+    connection = exception_context.connection
+    if connection is None or exception_context.execution_context is None or exception_context.is_pre_ping:
+        return
+    started = connection.info.get('query_started')
+    if started:
+        started.pop()
+
+
+# Shared, process-wide registry (enabled in create_app)
+metrics = Metrics()
@@ -0,0 +1,120 @@
+"""
+Schema upgrade for databases created by earlier versions of the app.
+
+Creates any missing tables, adds columns and indexes added since, moves each
+form's file_data into the content-addressed pdf_blobs table and finally
+drops the old column. Safe to run more than once.
+
+This is also the upgrade for databases from before pdf_forms.file_hash (the
+first release kept only file_data): the column is added, every form gets the
+hash of its bytes, and on Postgres the column then gets the NOT NULL and the
+foreign key to pdf_blobs that new databases are created with.
+
+Usage: python -m tax_form_app.migrate
+"""
+import logging
+from sqlalchemy import inspect, text
+from . import create_app
+from .models import db, PdfBlob
+from .blob_store import compute_hash
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Columns added to existing tables since the first release: (table, column, DDL)
+ADDED_COLUMNS = [
+    ('pdf_forms', 'file_hash', "VARCHAR(64)"),
+    ('pdf_forms', 'page_count', "INTEGER"),
+    ('pdf_forms', 'mapping_version', "INTEGER NOT NULL DEFAULT 0"),
+    ('pdf_forms', 'output_mode', "VARCHAR(20) NOT NULL DEFAULT 'full'"),
+    ('pdf_forms', 'updated_at', "TIMESTAMP"),
+    ('generation_jobs', 'output_mode', "VARCHAR(20)"),
+    ('entities', 'version', "INTEGER NOT NULL DEFAULT 1"),
+    ('entities', 'updated_at', "TIMESTAMP"),
+    ('pdf_form_fields', 'widgets', "JSON"),
+]
+
+
+def upgrade():
+    """Brings the current database up to the latest schema."""
+    db.create_all()
+    inspector = inspect(db.engine)
+    existing = {
+        table: {column['name'] for column in inspector.get_columns(table)}
+        for table in {table for table, _, _ in ADDED_COLUMNS}
+    }
+    columns = existing['pdf_forms']
+    file_hash_fk = any(fk['referred_table'] == 'pdf_blobs' for fk in inspector.get_foreign_keys('pdf_forms'))
+
+    with db.engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if column not in existing[table]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                logger.info(f"Added column {table}.{column}")
+
+        # Older saves could leave several rows for one PDF field; keep the newest before the unique index
+        conn.execute(text(
+            "DELETE FROM field_mappings WHERE id NOT IN "
+            "(SELECT MAX(id) FROM field_mappings GROUP BY form_id, pdf_field_name)"
+        ))
+
+        # Catalogs extracted before widget positions were stored are rebuilt on next use
+        conn.execute(text(
+            "UPDATE pdf_forms SET page_count = NULL WHERE id IN "
+            "(SELECT form_id FROM pdf_form_fields WHERE widgets IS NULL)"
+        ))
+
+        # create_all skips indexes of tables that already exist
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index._ddl_if is not None and index._ddl_if.dialect not in (None, conn.dialect.name):
+                    continue
+                index.create(conn, checkfirst=True)
+
+        if 'file_data' in columns:
+            form_ids = conn.execute(text("SELECT id FROM pdf_forms ORDER BY id")).scalars().all()
+            # One form at a time so memory stays bounded by the largest template
+            for form_id in form_ids:
+                file_data = conn.execute(
+                    text("SELECT file_data FROM pdf_forms WHERE id = :id"), {'id': form_id}
+                ).scalar_one()
+                content_hash = compute_hash(file_data)
+                exists = conn.execute(
+                    db.select(PdfBlob.sha256).where(PdfBlob.sha256 == content_hash)
+                ).first()
+                if not exists:
+                    conn.execute(db.insert(PdfBlob).values(
+                        sha256=content_hash, size=len(file_data), data=file_data
+                    ))
+                conn.execute(
+                    text("UPDATE pdf_forms SET file_hash = :hash WHERE id = :id"),
+                    {'hash': content_hash, 'id': form_id}
+                )
+                logger.info(f"Moved template bytes of form ID {form_id} to pdf_blobs ({content_hash[:12]})")
+
+            conn.execute(text("ALTER TABLE pdf_forms DROP COLUMN file_data"))
+            logger.info(f"Migrated {len(form_ids)} templates to pdf_blobs")
+
+        # Every form has its hash now; a form without one could never be loaded
+        unhashed = conn.execute(text("SELECT id FROM pdf_forms WHERE file_hash IS NULL ORDER BY id")).scalars().all()
+        if unhashed:
+            raise RuntimeError(f"Forms without template bytes or hash, fix or delete them first: {unhashed}")
+        # SQLite can't add constraints to an existing column; new SQLite databases have them from create_all
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("ALTER TABLE pdf_forms ALTER COLUMN file_hash SET NOT NULL"))
+            if not file_hash_fk:
+                conn.execute(text(
+                    "ALTER TABLE pdf_forms ADD CONSTRAINT pdf_forms_file_hash_fkey "
+                    "FOREIGN KEY (file_hash) REFERENCES pdf_blobs (sha256)"
+                ))
+                logger.info("Added foreign key pdf_forms.file_hash -> pdf_blobs.sha256")
+
+
+# -main-
+if __name__ == '__main__':
+    # Index builds on large tables can outlast the API's statement timeout
+    app = create_app({'DB_STATEMENT_TIMEOUT_MS': 0})
+    with app.app_context():
+        upgrade()
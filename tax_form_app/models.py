@@ -1,9 +1,21 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from .database import RoutingSession
 
 
 #loosely bound SQLAlchemy schema to prevent coupling
-db = SQLAlchemy()
+# (the session routes reads of @replica_reads routes to a replica when one is configured)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Entity attributes that can be mapped to PDF fields
+ENTITY_FIELDS = ['name', 'street_address', 'city', 'state', 'zip_code']
+
+# Everything Entity.to_dict can serialize, in output order
+ENTITY_COLUMNS = ['id'] + ENTITY_FIELDS + ['version', 'created_at', 'updated_at']
+
+# Entity columns covered by the listing's search
+ENTITY_SEARCH_FIELDS = ['name', 'city', 'state', 'zip_code']
 
 # --- Database Models (Schema) ---
 
@@ -12,6 +24,17 @@ class Entity(db.Model):
     Model for storing entity information (companies/individuals).
     """
     __tablename__ = 'entities'
+    __table_args__ = (
+        # Keyset pagination of the listing walks (name, id)
+        db.Index('ix_entities_name_id', 'name', 'id'),
+    ) + tuple(
+        # Trigram indexes serve the listing's substring search on Postgres; SQLite scans instead
+        db.Index(
+            f'ix_entities_{field}_trgm', field,
+            postgresql_using='gin', postgresql_ops={field: 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql')
+        for field in ENTITY_SEARCH_FIELDS
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
@@ -19,23 +42,149 @@ class Entity(db.Model):
     city = db.Column(db.String(100))
     state = db.Column(db.String(100))
     zip_code = db.Column(db.String(20))
+    # Bumped on every update; generated-output caches key on it
+    version = db.Column(db.Integer, nullable=False, default=1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def get_field(self, field_name):
         """Gets an entity attribute by its string name."""
         return getattr(self, field_name, None)
 
-    def to_dict(self):
-        """Serializes the object to a dictionary."""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'street_address': self.street_address,
-            'city': self.city,
-            'state': self.state,
-            'zip_code': self.zip_code,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
+    @classmethod
+    def criteria(cls, entity_ids=None, filters=None):
+        """
+        WHERE clauses for a set of entities: an explicit id list and/or
+        exact-match filters like {"state": "CA"}. Raises ValueError on unknown fields
+        or ids that are not integers.
+        """
+        clauses = []
+        if entity_ids is not None:
+            if not isinstance(entity_ids, list) or not all(
+                    isinstance(entity_id, int) and not isinstance(entity_id, bool) for entity_id in entity_ids):
+                raise ValueError('entity_ids must be a list of integers')
+            clauses.append(cls.id.in_(entity_ids))
+        for field, value in (filters or {}).items():
+            if field not in ENTITY_FIELDS:
+                raise ValueError(f"Invalid entity field '{field}'. Valid fields are: {', '.join(ENTITY_FIELDS)}")
+            clauses.append(getattr(cls, field) == value)
+        return clauses
+
+    @classmethod
+    def matching(cls, entity_ids=None, filters=None):
+        """Builds a query for a set of entities (see criteria), ordered by id."""
+        return cls.query.filter(*cls.criteria(entity_ids, filters)).order_by(cls.id)
+
+    @classmethod
+    def clean_value(cls, field, value):
+        """Normalizes one field's input; blank becomes None. Raises ValueError with a message for the client."""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        elif value is not None and not isinstance(value, str):
+            raise ValueError(f"Field '{field}' must be a string")
+        if isinstance(value, str):
+            value = value.strip() or None
+        max_length = cls.__table__.c[field].type.length
+        if value is not None and max_length and len(value) > max_length:
+            raise ValueError(f"Field '{field}' is longer than {max_length} characters")
+        return value
+
+    @classmethod
+    def validate(cls, data):
+        """
+        Checks entity input (a create request or an imported row) and returns the column values.
+        Blank optional fields become None. Raises ValueError with a message for the client.
+        """
+        if not isinstance(data, dict):
+            raise ValueError('Entity data must be an object')
+        values = {field: cls.clean_value(field, data.get(field)) for field in ENTITY_FIELDS}
+        if not values['name']:
+            raise ValueError('Name is required')
+        return values
+
+    @classmethod
+    def validate_changes(cls, data):
+        """Like validate, but only for the fields present in `data` (partial updates)."""
+        if not isinstance(data, dict) or not data:
+            raise ValueError('No fields to update')
+        unknown = [field for field in data if field not in ENTITY_FIELDS]
+        if unknown:
+            raise ValueError(f"Invalid entity fields: {', '.join(unknown)}. Valid fields are: {', '.join(ENTITY_FIELDS)}")
+        values = {field: cls.clean_value(field, value) for field, value in data.items()}
+        if 'name' in values and not values['name']:
+            raise ValueError('Name is required')
+        return values
+
+    @classmethod
+    def search(cls, query, text):
+        """Narrows a query to entities whose name, city, state or zip contains `text` (case-insensitive)."""
+        escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return query.filter(db.or_(*(
+            getattr(cls, field).ilike(f'%{escaped}%', escape='\\') for field in ENTITY_SEARCH_FIELDS
+        )))
+
+    def to_dict(self, fields=None):
+        """Serializes the object to a dictionary, limited to `fields` (see ENTITY_COLUMNS) if given."""
+        data = {}
+        for field in fields or ENTITY_COLUMNS:
+            value = getattr(self, field)
+            data[field] = value.isoformat() if isinstance(value, datetime) else value
+        return data
+
+# Trigram operators for the entities search indexes
+event.listen(
+    Entity.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+class TableVersion(db.Model):
+    """
+    Model for per-table change counters. Writers bump a table's row in the same
+    transaction as their change, so a listing's ETag is one primary-key read
+    instead of an aggregate over the table.
+    """
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True) # e.g. "entities"
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def bump(cls, name):
+        """Moves a table's counter on; call inside the writing transaction."""
+        now = datetime.utcnow()
+        updated = db.session.execute(
+            db.update(cls).where(cls.name == name).values(version=cls.version + 1, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            # Seeded when the table is created; this only covers a deleted row
+            db.session.execute(db.insert(cls).values(name=name, version=1, updated_at=now))
+
+    @classmethod
+    def current(cls, name):
+        """(version, updated_at) of a table, (0, None) if it was never written."""
+        row = db.session.execute(db.select(cls.version, cls.updated_at).where(cls.name == name)).first()
+        return tuple(row) if row else (0, None)
+
+# Counted tables start at version 0
+event.listen(
+    TableVersion.__table__, 'after_create',
+    DDL("INSERT INTO table_versions (name, version) VALUES ('entities', 0)")
+)
+
+class PdfBlob(db.Model):
+    """
+    Model for content-addressed PDF template bytes.
+    Identical uploads share a single row.
+    """
+    __tablename__ = 'pdf_blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    # Storing file data as 'LargeBinary' (BLOB), deferred so existence checks skip it
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class PdfForm(db.Model):
     """
@@ -45,23 +194,69 @@ class PdfForm(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     form_name = db.Column(db.String(255), nullable=False, unique=True)
-    # Storing file data as 'LargeBinary' (BLOB)
-    file_data = db.Column(db.LargeBinary, nullable=False)
+    # Template bytes live in pdf_blobs, addressed by their SHA-256
+    file_hash = db.Column(db.String(64), db.ForeignKey('pdf_blobs.sha256'), nullable=False, index=True)
+    # Filled in together with the field catalog at upload time
+    page_count = db.Column(db.Integer)
+    # Bumped on every mapping save; fill plans and other caches key on it
+    mapping_version = db.Column(db.Integer, nullable=False, default=0)
+    # Default PDF output mode for this form: 'full' or 'incremental'
+    output_mode = db.Column(db.String(20), nullable=False, default='full')
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Moves on any change to the row (settings, mapping saves); drives Last-Modified
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
-        """Serializes the object to a dictionary (without file_data)."""
+        """Serializes the object to a dictionary (without the template bytes)."""
         return {
             'id': self.id,
             'form_name': self.form_name,
+            'output_mode': self.output_mode,
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None
         }
 
+class PdfFormField(db.Model):
+    """
+    Model for the field catalog of a PDF form, extracted once at upload time.
+    """
+    __tablename__ = 'pdf_form_fields'
+    # Serves the per-form, name-ordered field listing from the index alone
+    __table_args__ = (db.Index('ix_pdf_form_fields_form_id_name', 'form_id', 'name'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    form_id = db.Column(db.Integer, db.ForeignKey('pdf_forms.id'), nullable=False)
+    name = db.Column(db.String(255), nullable=False) # fully qualified, e.g. "parent.child"
+    alternate_name = db.Column(db.Text) # /TU tooltip
+    field_type = db.Column(db.String(20), nullable=False) # text, checkbox, button, dropdown, list
+    parent = db.Column(db.String(255))
+    page_index = db.Column(db.Integer) # page of the first widget, 0-based
+    # Every widget of the field as [page index, position in the page's /Annots]
+    widgets = db.Column(db.JSON)
+    properties = db.Column(db.JSON) # raw field dictionary, stringified
+
+    form = db.relationship('PdfForm', backref=db.backref('catalog', lazy=True, cascade="all, delete-orphan"))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'alternate_name': self.alternate_name,
+            'type': self.field_type,
+            'parent': self.parent,
+            'page': self.page_index,
+            'pages': sorted({page_index for page_index, _ in self.widgets or ()})
+        }
+
 class FieldMapping(db.Model):
     """
     Model for mapping entity fields to PDF form fields.
     """
     __tablename__ = 'field_mappings'
+    # One mapping per PDF field; as form_id leads, this also serves every per-form lookup
+    __table_args__ = (
+        db.Index('ux_field_mappings_form_id_pdf_field_name', 'form_id', 'pdf_field_name', unique=True),
+        # Dependency lookups: which forms read a given entity field
+        db.Index('ix_field_mappings_entity_field_name_form_id', 'entity_field_name', 'form_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     # Foreign Key to link to the pdf_forms table
@@ -78,4 +273,119 @@ class FieldMapping(db.Model):
             'form_id': self.form_id,
             'pdf_field_name': self.pdf_field_name,
             'entity_field_name': self.entity_field_name
-        }
\ No newline at end of file
+        }
+class GenerationJob(db.Model):
+    """
+    Model for a background PDF generation run (one form, many entities).
+    Workers claim queued jobs through this table; no external broker is needed.
+    """
+    __tablename__ = 'generation_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    form_id = db.Column(db.Integer, db.ForeignKey('pdf_forms.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True) # queued, running, completed, failed, cancelled
+    total = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    output_mode = db.Column(db.String(20)) # overrides the form's output mode when set
+    worker = db.Column(db.String(100)) # worker currently holding the job
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime) # refreshed after every batch; stale jobs are reclaimed
+    finished_at = db.Column(db.DateTime)
+
+    form = db.relationship('PdfForm', backref=db.backref('jobs', lazy=True, cascade="all, delete-orphan", passive_deletes=True))
+
+    def to_dict(self):
+        processed = self.completed + self.failed
+        elapsed = None
+        if self.started_at:
+            elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return {
+            'id': self.id,
+            'form_id': self.form_id,
+            'status': self.status,
+            'total': self.total,
+            'completed': self.completed,
+            'failed': self.failed,
+            'output_mode': self.output_mode,
+            'pending': self.total - processed,
+            'progress': round(processed / self.total, 4) if self.total else 1.0,
+            'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+            'throughput_per_second': round(processed / elapsed, 2) if elapsed else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class GenerationJobItem(db.Model):
+    """
+    Model for one entity of a generation job. Doubles as the results store:
+    the filled PDF is kept in `output` until the job is deleted.
+    """
+    __tablename__ = 'generation_job_items'
+    # Workers fetch the next pending batch of a job in id order
+    __table_args__ = (db.Index('ix_generation_job_items_job_id_status', 'job_id', 'status', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('generation_jobs.id', ondelete='CASCADE'), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False) # no FK: results outlive deleted entities
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, done, failed
+    filename = db.Column(db.String(600))
+    output = db.deferred(db.Column(db.LargeBinary))
+    error = db.Column(db.Text)
+
+    job = db.relationship('GenerationJob', backref=db.backref('items', lazy='dynamic', cascade="all, delete-orphan", passive_deletes=True))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entity_id': self.entity_id,
+            'status': self.status,
+            'filename': self.filename,
+            'error': self.error
+        }
+
+class GeneratedDocument(db.Model):
+    """
+    Model for the latest stored output of one (entity, form) pair.
+    Entity and mapping writes flag the pairs whose output they change as stale,
+    so regeneration only has to redo those.
+    """
+    __tablename__ = 'generated_documents'
+    __table_args__ = (
+        db.Index('ux_generated_documents_entity_id_form_id', 'entity_id', 'form_id', unique=True),
+        # The stale listing walks one form's (or every form's) stale pairs in id order
+        db.Index('ix_generated_documents_stale_form_id', 'stale', 'form_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_id = db.Column(db.Integer, nullable=False) # no FK; rows are removed with their entity
+    form_id = db.Column(db.Integer, db.ForeignKey('pdf_forms.id', ondelete='CASCADE'), nullable=False)
+    job_item_id = db.Column(db.Integer) # generation_job_items row holding the output
+    entity_version = db.Column(db.Integer, nullable=False)
+    mapping_version = db.Column(db.Integer, nullable=False)
+    output_mode = db.Column(db.String(20))
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    stale = db.Column(db.Boolean, nullable=False, default=False)
+    stale_since = db.Column(db.DateTime)
+    stale_reason = db.Column(db.String(255)) # first change that made it stale, e.g. "city" or "mappings"
+
+    form = db.relationship('PdfForm', backref=db.backref('documents', lazy='dynamic', cascade="all, delete-orphan", passive_deletes=True))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entity_id': self.entity_id,
+            'form_id': self.form_id,
+            'job_item_id': self.job_item_id,
+            'entity_version': self.entity_version,
+            'mapping_version': self.mapping_version,
+            'output_mode': self.output_mode,
+            'generated_at': self.generated_at.isoformat() if self.generated_at else None,
+            'stale': self.stale,
+            'stale_since': self.stale_since.isoformat() if self.stale_since else None,
+            'stale_reason': self.stale_reason
+        }
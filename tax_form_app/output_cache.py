@@ -0,0 +1,232 @@
+"""
+Disk-backed cache of generated PDFs.
+
+Entries are keyed by everything that decides the output bytes: the entity id
+and row version, the form id, template hash and mapping version, the output
+mode and the pypdf version. Filling is deterministic, so the key digest also
+serves as a strong ETag and conditional requests never need to fill at all.
+
+Files live under <directory>/<form id>/<entity id>/<digest>.pdf, so a form or
+an entity can be invalidated by removing one directory.
+"""
+import os
+import shutil
+import hashlib
+import functools
+import importlib.metadata
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Default cache budget: 1 GB of generated PDFs on disk
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'tax_form_app_output_cache')
+
+
+@functools.lru_cache(maxsize=None)
+def _pypdf_version():
+    # Read from the package metadata, so computing keys doesn't import pypdf
+    return importlib.metadata.version('pypdf')
+
+
+def output_key(entity, form, output_mode):
+    """Digest of the inputs of one generated PDF; used as file name and ETag."""
+    # Creation times tell apart rows whose ids were reused (e.g. after a database reset)
+    parts = (
+        entity.id, entity.created_at, entity.version,
+        form.id, form.uploaded_at, form.file_hash, form.mapping_version,
+        output_mode, _pypdf_version()
+    )
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class OutputCache:
+    """
+    LRU cache of generated PDFs on disk, bounded by total file size.
+    Recency is tracked in memory and mirrored to file mtimes, so the order
+    survives a restart. A max_bytes of 0 disables storing.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = None # relative path -> size, oldest first; loaded on first use
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, directory, max_bytes):
+        """Changes the directory and byte budget; the index is rebuilt lazily."""
+        with self._lock:
+            self.directory = directory
+            self.max_bytes = max_bytes
+            self._entries = None
+            self._current_bytes = 0
+
+    def get(self, key, form_id, entity_id):
+        """
+        Returns the cached PDF bytes for a key, or None. The lock only covers the
+        index; the file is read outside it, so hits don't queue behind each other.
+        """
+        if self.max_bytes <= 0:
+            return None
+        path = self._path(key, form_id, entity_id)
+        with self._lock:
+            self._load()
+            full_path = os.path.join(self.directory, path)
+        try:
+            with open(full_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Evicted or invalidated, possibly by another thread or process
+            with self._lock:
+                if self._entries is not None:
+                    self._forget(path)
+                self.misses += 1
+            return None
+        try:
+            os.utime(full_path)
+            present = True
+        except FileNotFoundError:
+            # Evicted since the read; the bytes are still good
+            present = False
+        with self._lock:
+            self._load()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            elif present:
+                self._entries[path] = len(data)
+                self._current_bytes += len(data)
+            self.hits += 1
+        return data
+
+    def put(self, key, form_id, entity_id, data):
+        """Stores generated PDF bytes, evicting the least recently used files if needed."""
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        path = self._path(key, form_id, entity_id)
+        full_path = os.path.join(self.directory, path)
+        with self._lock:
+            self._load()
+            try:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                # Write then rename, so readers never see a partial file
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, full_path)
+            except OSError as e:
+                logger.warning(f"Could not write {path} to output cache: {e}")
+                return
+            self._forget(path)
+            self._entries[path] = len(data)
+            self._current_bytes += len(data)
+            self._evict()
+
+    def invalidate_form(self, form_id):
+        """Drops every cached PDF of a form."""
+        self._remove_trees([str(form_id)])
+
+    def invalidate_entity(self, entity_id):
+        """Drops every cached PDF of an entity, across all forms."""
+        self.invalidate_entities([entity_id])
+
+    def invalidate_entities(self, entity_ids):
+        """Drops every cached PDF of the given entities, across all forms."""
+        names = {str(entity_id) for entity_id in entity_ids}
+        if not names or not os.path.isdir(self.directory):
+            return
+        # One listing per form directory, whatever the number of ids
+        dirs = []
+        for form_dir in os.listdir(self.directory):
+            try:
+                entity_dirs = os.listdir(os.path.join(self.directory, form_dir))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            dirs += [os.path.join(form_dir, name) for name in names.intersection(entity_dirs)]
+        self._remove_trees(dirs)
+
+    def clear(self):
+        """Removes all cached files and resets the counters."""
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._entries = OrderedDict()
+            self._current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and current usage."""
+        with self._lock:
+            self._load()
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'entries': len(self._entries),
+                'current_bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def _path(self, key, form_id, entity_id):
+        return os.path.join(str(form_id), str(entity_id), f"{key}.pdf")
+
+    def _load(self):
+        """Indexes the files already on disk, oldest first. Caller holds the lock."""
+        if self._entries is not None:
+            return
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith('.pdf'):
+                    found.append((stat.st_mtime, os.path.relpath(full_path, self.directory), stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in found)
+        self._current_bytes = sum(size for _, _, size in found)
+        self._evict()
+
+    def _forget(self, path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._current_bytes -= size
+
+    def _remove_trees(self, relative_dirs):
+        """Drops form (<form>) or entity (<form>/<entity>) directories with one pass over the index."""
+        dirs = set(relative_dirs)
+        if not dirs:
+            return
+        with self._lock:
+            self._load()
+            for path in [p for p in self._entries if os.path.dirname(p) in dirs or p.split(os.sep, 1)[0] in dirs]:
+                self._forget(path)
+        # Outside the lock: lookups only need the index, and keys carry the entity version anyway
+        for relative_dir in dirs:
+            shutil.rmtree(os.path.join(self.directory, relative_dir), ignore_errors=True)
+
+    def _evict(self):
+        while self._current_bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._current_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, path))
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Evicted {path} from output cache")
+
+
+# Shared, process-wide cache instance (configured in create_app)
+output_cache = OutputCache()
@@ -0,0 +1,161 @@
+"""
+Packets: several filled forms merged into one PDF.
+
+Each form's fields are moved under a parent field named after the form, so
+identical field names in different forms don't collide in the combined
+AcroForm ("name" in form 3 becomes "form3.name"). Like filling.py, nothing
+here touches Flask or the database, and pypdf is imported on first use.
+"""
+import io
+import queue
+import logging
+import threading
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Bytes per streamed chunk, and chunks buffered ahead of a slow client
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_QUEUE_CHUNKS = 16
+
+
+def _acroform_fields(writer):
+    acro_form = writer._root_object.get('/AcroForm')
+    if acro_form is None:
+        return None
+    return acro_form.get_object()['/Fields'].get_object()
+
+
+def _namespace_fields(writer, first_index, namespace):
+    """Moves the top-level fields added from index `first_index` on under one parent field."""
+    from pypdf.generic import ArrayObject, DictionaryObject, NameObject, TextStringObject
+    fields = _acroform_fields(writer)
+    if fields is None or len(fields) <= first_index:
+        return
+    kids = ArrayObject(fields[first_index:])
+    parent = writer._add_object(DictionaryObject({
+        NameObject('/T'): TextStringObject(namespace),
+        NameObject('/Kids'): kids,
+    }))
+    for kid in kids:
+        kid.get_object()[NameObject('/Parent')] = parent
+    del fields[first_index:]
+    fields.append(parent)
+
+
+def _merge_default_resources(writer, reader):
+    """Copies fonts from a source form's /DR that the combined AcroForm lacks."""
+    from pypdf.generic import DictionaryObject, NameObject
+    source = reader.root_object.get('/AcroForm')
+    target = writer._root_object.get('/AcroForm')
+    if source is None or target is None:
+        return
+    source_fonts = source.get_object().get('/DR', {}).get_object().get('/Font')
+    if source_fonts is None:
+        return
+    target = target.get_object()
+    if '/DR' not in target:
+        target[NameObject('/DR')] = DictionaryObject()
+    resources = target['/DR'].get_object()
+    if '/Font' not in resources:
+        resources[NameObject('/Font')] = DictionaryObject()
+    target_fonts = resources['/Font'].get_object()
+    for name, font in source_fonts.get_object().items():
+        if name not in target_fonts:
+            target_fonts[NameObject(name)] = font.clone(writer)
+
+
+def merge_packet(parts):
+    """
+    Merges filled PDFs into one writer, in order.
+    `parts` is a list of (namespace, pdf bytes); each part's fields end up under its namespace.
+    """
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter()
+    for namespace, pdf_bytes in parts:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        fields = _acroform_fields(writer)
+        first_index = len(fields) if fields is not None else 0
+        writer.append(reader)
+        _namespace_fields(writer, first_index, namespace)
+        _merge_default_resources(writer, reader)
+    if '/AcroForm' in writer._root_object:
+        writer.set_need_appearances_writer(True)
+    return writer
+
+
+class _QueueSink(io.RawIOBase):
+    """Write-only sink handing full chunks to a bounded queue; tracks the offset pypdf asks for."""
+
+    def __init__(self, chunks, cancelled):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= STREAM_CHUNK_SIZE:
+            self.put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self.put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def put(self, item):
+        # Give up once the client has gone, instead of blocking forever
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise IOError('Client disconnected')
+
+
+def stream_pdf(writer):
+    """
+    Streams a writer's output as it is serialized.
+    pypdf writes in a background thread; chunks are handed over through a bounded queue.
+    """
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    sink = _QueueSink(chunks, cancelled)
+    errors = []
+
+    def produce():
+        try:
+            writer.write(sink)
+            sink.flush()
+        except Exception as e:
+            if not cancelled.is_set():
+                logger.error(f"Error writing packet PDF: {e}", exc_info=True)
+                errors.append(e)
+        finally:
+            try:
+                sink.put(None)
+            except IOError:
+                pass
+
+    thread = threading.Thread(target=produce, name='packet-writer', daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+    finally:
+        cancelled.set()
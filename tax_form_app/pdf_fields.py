@@ -0,0 +1,97 @@
+import logging
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# /Ff bit 2: the field must have a value when the form is submitted
+REQUIRED_FLAG = 1 << 1
+
+
+def _text(value):
+    """Converts a PDF string/name object to a plain Python string."""
+    if value is None:
+        return None
+    if hasattr(value, 'get_text'):
+        return value.get_text()
+    return str(value)
+
+
+def field_type_display(field_obj):
+    """Maps the /FT type and /Ff flag bits of a field to a frontend-friendly type."""
+    field_type_str = str(field_obj.get('/FT', '/Tx'))  # Default to text if type not specified
+    flags = field_obj.get('/Ff', 0)
+    if "/Btn" in field_type_str:
+        return "checkbox" if flags & (1 << 15) else "button"
+    elif "/Ch" in field_type_str:
+        return "dropdown" if flags & (1 << 17) else "list"
+    return "text"
+
+
+def is_required(properties):
+    """True if a catalog entry's stringified properties carry the Required flag."""
+    try:
+        return bool(int((properties or {}).get('/Ff') or 0) & REQUIRED_FLAG)
+    except ValueError:
+        return False
+
+
+def qualified_name(annotation):
+    """Builds the fully qualified field name (parent.child) of a widget annotation."""
+    parts = []
+    node = annotation
+    while node is not None:
+        if '/T' in node:
+            parts.append(_text(node['/T']))
+        parent = node.get('/Parent')
+        node = parent.get_object() if parent is not None else None
+    return '.'.join(reversed(parts)) if parts else None
+
+
+def widget_positions(reader):
+    """
+    Returns {qualified field name: [[page index, annotation index], ...]} for
+    every widget annotation, the annotation index being its position in the
+    page's /Annots. A field can have widgets on several pages.
+    """
+    positions = {}
+    for page_index, page in enumerate(reader.pages):
+        annots = page.get('/Annots')
+        if annots is None:
+            continue
+        for annot_index, annot in enumerate(annots.get_object()):
+            annot = annot.get_object()
+            if annot.get('/Subtype') != '/Widget':
+                continue
+            name = qualified_name(annot)
+            if name is None:
+                continue
+            positions.setdefault(name, []).append([page_index, annot_index])
+    return positions
+
+
+def extract_field_catalog(reader, fields=None):
+    """
+    Extracts the field catalog of a PDF form: one dict per field with its name,
+    /TU alternate name, display type, parent, widget positions (see
+    widget_positions), first widget page and raw properties.
+    """
+    if fields is None:
+        fields = reader.get_fields() or {}
+    positions = widget_positions(reader)
+
+    catalog = []
+    for field_name, field_obj in fields.items():
+        # Raw field properties, stringified for the debug endpoint
+        properties = {str(key): _text(value) for key, value in field_obj.items()}
+        widgets = positions.get(field_name, [])
+        catalog.append({
+            'name': field_name,
+            'alternate_name': _text(field_obj.get('/TU', None)),
+            'field_type': field_type_display(field_obj),
+            # Include parent name for nested fields if applicable
+            'parent': field_name.split('.')[0] if '.' in field_name else None,
+            'widgets': widgets,
+            'page_index': widgets[0][0] if widgets else None,
+            'properties': properties
+        })
+    return catalog
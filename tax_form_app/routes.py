@@ -1,8 +1,29 @@
 import io
+import csv
+import json
+import base64
 import logging
-from flask import request, jsonify, send_file, Blueprint
-from pypdf import PdfReader, PdfWriter
-from .models import db, Entity, PdfForm, FieldMapping
+from datetime import datetime
+from flask import request, jsonify, send_file, Blueprint, Response, current_app, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+from sqlalchemy.orm import load_only
+from .models import db, Entity, PdfForm, PdfFormField, FieldMapping, TableVersion, ENTITY_FIELDS, ENTITY_COLUMNS
+from .documents import mark_entities_changed, mark_form_changed, forget_entities, forget_form, stale_documents, stale_pairs
+from .jobs import queue_job
+from .database import replica_reads
+from .coverage import mapping_coverage, DEFAULT_LIMIT as COVERAGE_LIMIT, MAX_LIMIT as COVERAGE_MAX_LIMIT
+from .template_cache import template_cache
+from .blob_store import put_blob, release_blob, load_template, ensure_catalog, hash_stream, DEFAULT_MAX_TEMPLATE_BYTES
+from .pdf_fields import extract_field_catalog
+from .filling import output_filename, resolve_output_mode
+from .fill_plan import fill_plans
+from .fill_pool import fill_pool, PoolSaturated, FillTimeout
+from .metrics import metrics
+from .http_cache import cached_json, make_etag
+from .zip_stream import stream_zip
+from .output_cache import output_cache, output_key
+from .packet import merge_packet, stream_pdf
+from .entity_import import detect_format, read_rows, import_entities, DEFAULT_BATCH_SIZE as IMPORT_BATCH_SIZE
 
 # Create a Blueprint. This is how we organize routes in a separate file.
 # The 'api' name is used to prefix all routes, e.g., '/api/entities'
@@ -11,6 +32,98 @@ api = Blueprint('api', __name__, url_prefix='/api')
 # Get the logger
 logger = logging.getLogger(__name__)
 
+@api.errorhandler(PoolSaturated)
+def handle_pool_saturated(e):
+    """PDF work is at capacity: tell the client when to come back instead of queueing without limit."""
+    logger.warning(f"Rejected request with 503: {e}")
+    response = jsonify({'error': str(e)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@api.errorhandler(FillTimeout)
+def handle_fill_timeout(e):
+    """A fill ran past FILL_TIMEOUT_SECONDS."""
+    logger.warning(f"Fill timed out: {e}")
+    return jsonify({'error': str(e)}), 504
+
+@api.errorhandler(RequestEntityTooLarge)
+def handle_too_large(e):
+    """An upload went past its size limit; werkzeug stopped reading it."""
+    return jsonify({'error': 'The uploaded file is too large'}), 413
+
+# Entity listing page sizes
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Rows fetched per round trip by the streaming export
+EXPORT_YIELD_PER = 1000
+# Ids per statement in bulk updates and deletes (all in one transaction)
+BULK_ID_CHUNK = 1000
+
+# Forms per packet
+MAX_PACKET_FORMS = 50
+
+# Multipart framing and the form_name field, on top of the template itself
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+def _encode_cursor(name, entity_id):
+    """Opaque keyset cursor for the entity listing."""
+    return base64.urlsafe_b64encode(json.dumps([name, entity_id]).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """Reverses _encode_cursor; raises ValueError on anything malformed."""
+    try:
+        name, entity_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(name, str) or not isinstance(entity_id, int):
+        raise ValueError('Invalid cursor')
+    return name, entity_id
+
+def _is_id(value):
+    """True for an integer id from a JSON body (true/false are not ids)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _requested_fields():
+    """Parses ?fields=a,b into a list of entity columns (None if absent); raises ValueError on unknown ones."""
+    if not request.args.get('fields'):
+        return None
+    fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+    invalid = [field for field in fields if field not in ENTITY_COLUMNS]
+    if invalid:
+        raise ValueError(f"Invalid fields: {', '.join(invalid)}. Valid fields are: {', '.join(ENTITY_COLUMNS)}")
+    return fields
+
+def _entity_selection(data):
+    """
+    Reads "entity_ids" and/or "filter" from a bulk request body into WHERE clauses.
+    Raises ValueError unless at least one non-empty selector is given.
+    """
+    entity_ids = data.get('entity_ids')
+    filters = data.get('filter')
+    if entity_ids is None and not filters:
+        raise ValueError('Invalid data. Required: entity_ids or a non-empty filter')
+    if entity_ids is not None and (not isinstance(entity_ids, list) or not all(_is_id(entity_id) for entity_id in entity_ids)):
+        raise ValueError('entity_ids must be a list of integers')
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError('filter must be an object')
+    return entity_ids, filters
+
+def _entities_etag():
+    """
+    ETag for an entity listing from the entities change counter, which every
+    insert, update and delete bumps. Returns (etag, time of the last change).
+    """
+    version, last_updated = TableVersion.current('entities')
+    return make_etag('entities', version, request.query_string.decode()), last_updated
+
+def _id_chunks(entity_ids):
+    """Splits an id list so IN lists stay a manageable size; None means "no id list"."""
+    if entity_ids is None:
+        return [None]
+    return [entity_ids[i:i + BULK_ID_CHUNK] for i in range(0, len(entity_ids), BULK_ID_CHUNK)]
+
 # --- API Endpoints for Entities (CRUD) ---
 @api.route('/entities', methods=['POST'])
 def create_entity():
@@ -18,22 +131,217 @@ def create_entity():
     data = request.json
     if not data or not data.get('name'):
         return jsonify({'error': 'Name is required'}), 400
-    new_entity = Entity(
-        name=data.get('name'),
-        street_address=data.get('street_address'),
-        city=data.get('city'),
-        state=data.get('state'),
-        zip_code=data.get('zip_code')
-    )
+    try:
+        new_entity = Entity(**Entity.validate(data))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     db.session.add(new_entity)
+    TableVersion.bump('entities')
     db.session.commit()
     return jsonify(new_entity.to_dict()), 201
 
+@api.route('/entities/import', methods=['POST'])
+def import_entities_file():
+    """
+    Bulk-imports entities from a CSV (with a header row) or NDJSON file.
+    Send the file as multipart "file", or as the raw request body with a text/csv
+    or application/x-ndjson content type; ?format=csv|ndjson overrides detection.
+    Rows are validated like POST /api/entities; bad rows are reported by line, not fatal.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    elif request.content_length or request.headers.get('Transfer-Encoding') == 'chunked':
+        stream, filename, content_type = request.stream, None, request.mimetype
+    else:
+        return jsonify({'error': 'No file provided'}), 400
+
+    try:
+        file_format = detect_format(request.args.get('format'), filename, content_type)
+        report = import_entities(
+            read_rows(stream, file_format),
+            current_app.config.get('ENTITY_IMPORT_BATCH_SIZE', IMPORT_BATCH_SIZE)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing entities: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to import entities: {str(e)}'}), 500
+    return jsonify(report), 200
+
 @api.route('/entities', methods=['GET'])
+@replica_reads
 def get_all_entities():
-    """Gets all entities."""
-    entities = Entity.query.order_by(Entity.name).all()
-    return jsonify([entity.to_dict() for entity in entities]), 200
+    """
+    Gets entities ordered by name.
+    Without parameters, returns all of them as a plain array (legacy behaviour).
+    With any of limit, after, q or fields, returns one page:
+    {"entities": [...], "next_after": <cursor for the next page or null>}.
+    - limit: page size (default 50, max 500)
+    - after: the previous page's next_after
+    - q: case-insensitive substring search over name, city, state and zip code
+    - fields: comma-separated columns to return, e.g. "id,name,city"
+    Unchanged data is answered with 304 (see _entities_etag).
+    """
+    etag, last_updated = _entities_etag()
+    if not any(param in request.args for param in ('limit', 'after', 'q', 'fields')):
+        return cached_json(
+            lambda: [entity.to_dict() for entity in Entity.query.order_by(Entity.name, Entity.id).all()],
+            etag, last_updated
+        )
+
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    try:
+        fields = _requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = Entity.query
+    if fields:
+        # Only the requested columns (plus the cursor's) are selected
+        query = query.options(load_only(*(getattr(Entity, field) for field in set(fields) | {'id', 'name'})))
+    if request.args.get('q'):
+        query = Entity.search(query, request.args['q'])
+    if request.args.get('after'):
+        try:
+            after_name, after_id = _decode_cursor(request.args['after'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(db.tuple_(Entity.name, Entity.id) > (after_name, after_id))
+
+    def page():
+        # One extra row tells whether there is a next page
+        entities = query.order_by(Entity.name, Entity.id).limit(limit + 1).all()
+        next_after = None
+        if len(entities) > limit:
+            entities = entities[:limit]
+            next_after = _encode_cursor(entities[-1].name, entities[-1].id)
+        return {
+            'entities': [entity.to_dict(fields) for entity in entities],
+            'next_after': next_after
+        }
+    return cached_json(page, etag, last_updated)
+
+@api.route('/entities/export', methods=['GET'])
+@replica_reads
+def export_entities():
+    """
+    Streams entities as NDJSON (default) or CSV (?format=csv), ordered by id.
+    Accepts q and fields like the listing, plus exact-match filters on any
+    entity field, e.g. ?state=CA. Rows are read through a server-side cursor.
+    """
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in ('ndjson', 'csv'):
+        return jsonify({'error': f"Invalid format '{file_format}'. Allowed: ndjson, csv"}), 400
+    try:
+        fields = _requested_fields() or ENTITY_COLUMNS
+        filters = {field: request.args[field] for field in ENTITY_FIELDS if field in request.args}
+        statement = db.select(Entity).where(*Entity.criteria(filters=filters)).order_by(Entity.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    statement = statement.options(load_only(*(getattr(Entity, field) for field in fields)))
+    if request.args.get('q'):
+        statement = Entity.search(statement, request.args['q'])
+
+    def ndjson_lines():
+        rows = db.session.execute(statement.execution_options(yield_per=EXPORT_YIELD_PER)).scalars()
+        for entity in rows:
+            yield json.dumps(entity.to_dict(fields)) + '\n'
+
+    def csv_lines():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        rows = db.session.execute(statement.execution_options(yield_per=EXPORT_YIELD_PER)).scalars()
+        for entity in rows:
+            writer.writerow(entity.to_dict(fields))
+            # Hand over roughly one buffer's worth at a time
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if file_format == 'csv':
+        body, mimetype, filename = csv_lines(), 'text/csv', 'entities.csv'
+    else:
+        body, mimetype, filename = ndjson_lines(), 'application/x-ndjson', 'entities.ndjson'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@api.route('/entities/bulk-update', methods=['POST'])
+def bulk_update_entities():
+    """
+    Applies the same changes to many entities in one transaction.
+    Body: {"entity_ids": [...] and/or "filter": {...}, "set": {"city": "...", ...}}.
+    """
+    data = request.json
+    if not data or 'set' not in data:
+        return jsonify({'error': 'Invalid data. Required: set and entity_ids or filter'}), 400
+    try:
+        entity_ids, filters = _entity_selection(data)
+        changes = Entity.validate_changes(data['set'])
+        clauses = Entity.criteria(filters=filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        updated_ids = []
+        for chunk in _id_chunks(entity_ids):
+            chunk_clauses = clauses + ([Entity.id.in_(chunk)] if chunk is not None else [])
+            updated_ids += db.session.execute(
+                db.update(Entity)
+                .where(*chunk_clauses)
+                .values(**changes, version=Entity.version + 1, updated_at=datetime.utcnow())
+                .returning(Entity.id)
+            ).scalars().all()
+        mark_entities_changed(updated_ids, changes)
+        TableVersion.bump('entities')
+        db.session.commit()
+        output_cache.invalidate_entities(updated_ids)
+        logger.info(f"Bulk-updated {len(updated_ids)} entities: {sorted(changes)}")
+        return jsonify({'updated': len(updated_ids), 'entity_ids': updated_ids}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error bulk-updating entities: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to update entities: {str(e)}'}), 500
+
+@api.route('/entities/bulk-delete', methods=['POST'])
+def bulk_delete_entities():
+    """
+    Deletes many entities in one transaction.
+    Body: {"entity_ids": [...] and/or "filter": {...}}.
+    """
+    data = request.json
+    if not data:
+        return jsonify({'error': 'Invalid data. Required: entity_ids or filter'}), 400
+    try:
+        entity_ids, filters = _entity_selection(data)
+        clauses = Entity.criteria(filters=filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        deleted_ids = []
+        for chunk in _id_chunks(entity_ids):
+            chunk_clauses = clauses + ([Entity.id.in_(chunk)] if chunk is not None else [])
+            deleted_ids += db.session.execute(
+                db.delete(Entity).where(*chunk_clauses).returning(Entity.id)
+            ).scalars().all()
+        forget_entities(deleted_ids)
+        TableVersion.bump('entities')
+        db.session.commit()
+        output_cache.invalidate_entities(deleted_ids)
+        logger.info(f"Bulk-deleted {len(deleted_ids)} entities")
+        return jsonify({'deleted': len(deleted_ids), 'entity_ids': deleted_ids}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error bulk-deleting entities: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to delete entities: {str(e)}'}), 500
 
 @api.route('/entities/<int:id>', methods=['GET'])
 def get_entity(id):
@@ -53,12 +361,26 @@ def update_entity(id):
     data = request.json
     if not data:
         return jsonify({'error': 'No data provided'}), 400
-    entity.name = data.get('name', entity.name)
-    entity.street_address = data.get('street_address', entity.street_address)
-    entity.city = data.get('city', entity.city)
-    entity.state = data.get('state', entity.state)
-    entity.zip_code = data.get('zip_code', entity.zip_code)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Entity data must be an object'}), 400
+    # Other keys (e.g. id or version from a GET body sent back) are ignored
+    fields = {field: data[field] for field in ENTITY_FIELDS if field in data}
+    try:
+        values = Entity.validate_changes(fields) if fields else {}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    changed = {field: value for field, value in values.items() if value != entity.get_field(field)}
+    if not changed:
+        # Nothing to store, so the version, documents and caches stay as they are
+        return jsonify(entity.to_dict()), 200
+    for field, value in changed.items():
+        setattr(entity, field, value)
+    entity.version = Entity.version + 1
+    # Only documents of forms that map a changed field need regenerating
+    mark_entities_changed([id], changed)
+    TableVersion.bump('entities')
     db.session.commit()
+    output_cache.invalidate_entity(id)
     return jsonify(entity.to_dict()), 200
 
 @api.route('/entities/<int:id>', methods=['DELETE'])
@@ -68,13 +390,25 @@ def delete_entity(id):
     if not entity:
         return jsonify({'error': 'Entity not found'}), 404
     db.session.delete(entity)
+    forget_entities([id])
+    TableVersion.bump('entities')
     db.session.commit()
+    output_cache.invalidate_entity(id)
     return jsonify({'message': 'Entity deleted successfully'}), 200
 
 # --- API Endpoints for PDF Forms ---
 @api.route('/forms/upload', methods=['POST'])
 def upload_form():
-    """Uploads a new PDF form template."""
+    """
+    Uploads a new PDF form template.
+    The file is spooled to disk by the form parser and hashed in chunks; an
+    upload identical to an existing form is rejected (409) before it is parsed,
+    unless REJECT_DUPLICATE_TEMPLATES is off. Larger than MAX_TEMPLATE_BYTES is 413.
+    """
+    max_bytes = current_app.config.get('MAX_TEMPLATE_BYTES', DEFAULT_MAX_TEMPLATE_BYTES)
+    # Werkzeug stops reading the body past this, and moves file parts over 500 KB to a temp file
+    request.max_content_length = max_bytes + UPLOAD_OVERHEAD_BYTES
+
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -83,37 +417,94 @@ def upload_form():
         return jsonify({'error': 'Form name is required'}), 400
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
+    try:
+        output_mode = resolve_output_mode(request.form.get('output_mode'), 'full')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if file and file.filename.endswith('.pdf'):
         existing_form = PdfForm.query.filter_by(form_name=form_name).first()
         if existing_form:
             return jsonify({'error': 'A form with this name already exists'}), 409
-        file_data = file.read()
-        
-        # Verify the PDF has form fields before accepting it
+
+        content_hash, size = hash_stream(file.stream)
+        if size > max_bytes:
+            return jsonify({'error': f'The uploaded file is larger than {max_bytes} bytes'}), 413
+        if current_app.config.get('REJECT_DUPLICATE_TEMPLATES', True):
+            duplicate = PdfForm.query.filter_by(file_hash=content_hash).first()
+            if duplicate:
+                return jsonify({
+                    'error': f"This template was already uploaded as form '{duplicate.form_name}'",
+                    'form_id': duplicate.id
+                }), 409
+
+        # Verify the PDF has form fields before accepting it, reading from the spooled file
+        from pypdf import PdfReader
         try:
-            pdf_file_stream = io.BytesIO(file_data)
-            reader = PdfReader(pdf_file_stream)
+            reader = PdfReader(file.stream)
             fields = reader.get_fields()
             
             if not fields:
                 return jsonify({'error': 'The uploaded PDF does not contain any fillable form fields'}), 400
+
+            # Keep the field catalog so listings never re-parse the PDF
+            catalog = extract_field_catalog(reader, fields)
+            page_count = len(reader.pages)
                 
         except Exception as e:
             logger.error(f"Error checking PDF form fields: {e}")
             return jsonify({'error': 'Could not read PDF form fields'}), 400
-        
-        new_form = PdfForm(form_name=form_name, file_data=file_data)
+
+        # The one in-memory copy, for the insert
+        file.stream.seek(0)
+        new_form = PdfForm(
+            form_name=form_name,
+            file_hash=put_blob(file.stream.read(), content_hash),
+            page_count=page_count,
+            output_mode=output_mode
+        )
+        # Catalog rows are written in the same transaction as the form
+        new_form.catalog = [PdfFormField(**entry) for entry in catalog]
         db.session.add(new_form)
         db.session.commit()
+
+        # Form ids can be reused after a delete, so drop anything stale. The reader reads from
+        # the spooled file, which goes away with the request: the first fill loads the template.
+        template_cache.invalidate(new_form.id)
         return jsonify(new_form.to_dict()), 201
     else:
         return jsonify({'error': 'Invalid file type, only PDF allowed'}), 400
 
 @api.route('/forms', methods=['GET'])
+@replica_reads
 def get_all_forms():
-    """Gets all uploaded PDF forms (metadata only)."""
-    forms = PdfForm.query.order_by(PdfForm.form_name).all()
-    return jsonify([form.to_dict() for form in forms]), 200
+    """Gets all uploaded PDF forms (metadata only). Unchanged lists are answered with 304."""
+    count, last_updated, max_id = db.session.execute(
+        db.select(db.func.count(PdfForm.id), db.func.max(PdfForm.updated_at), db.func.max(PdfForm.id))
+    ).one()
+    return cached_json(
+        lambda: [form.to_dict() for form in PdfForm.query.order_by(PdfForm.form_name).all()],
+        make_etag('forms', count, last_updated, max_id), last_updated
+    )
+
+@api.route('/forms/<int:id>', methods=['PUT'])
+def update_form(id):
+    """Updates a form's settings (currently its default output_mode)."""
+    form = db.session.get(PdfForm, id)
+    if not form:
+        return jsonify({'error': 'Form not found'}), 404
+    data = request.json
+    if not data or 'output_mode' not in data:
+        return jsonify({'error': 'Invalid data. Required: output_mode'}), 400
+    try:
+        output_mode = resolve_output_mode(data['output_mode'], None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if output_mode != form.output_mode:
+        form.output_mode = output_mode
+        mark_form_changed(id, 'output_mode')
+    db.session.commit()
+    return jsonify(form.to_dict()), 200
+
 @api.route('/forms/<int:id>', methods=['DELETE'])
 def delete_form(id):
     """Deletes a PDF form."""
@@ -122,8 +513,15 @@ def delete_form(id):
         return jsonify({'error': 'Form not found'}), 404
         
     try:
+        forget_form(id)
         db.session.delete(form)
+        db.session.flush()
+        # Drop the template bytes unless another form shares them
+        release_blob(form.file_hash)
         db.session.commit()
+        template_cache.invalidate(id)
+        fill_plans.invalidate(id)
+        output_cache.invalidate_form(id)
         logger.info(f"Deleted form ID {id} ({form.form_name})")
         return jsonify({'message': 'Form deleted successfully'}), 200
     except Exception as e:
@@ -132,79 +530,72 @@ def delete_form(id):
         return jsonify({'error': f'Failed to delete form: {str(e)}'}), 500
 
 @api.route('/forms/<int:id>/fields', methods=['GET'])
+@replica_reads
 def get_form_fields(id):
     """
     Retrieves all fillable field names and their properties from a specific PDF form.
     Enhanced to extract more field metadata and handle different field types.
+    The catalog only changes with the template, so revalidations are answered with 304.
     """
     form = db.session.get(PdfForm, id)
     if not form:
         return jsonify({'error': 'Form not found'}), 404
 
-    try:
-        pdf_file = io.BytesIO(form.file_data)
-        reader = PdfReader(pdf_file)
-        fields = reader.get_fields()
-        
-        if not fields:
-            return jsonify({'form_id': id, 'form_name': form.form_name, 'fields': []}), 200
-
-        # Enhanced field extraction with type detection and additional properties
-        field_data = []
-        for field_name, field_obj in fields.items():
-            # Get field properties
-            field_type = field_obj.get('/FT', '/Tx')  # Default to text if type not specified
-            field_type_str = str(field_type)  # Convert to string for easier comparison
-            
-            # Get tooltip (alternate name)
-            alternate_name = field_obj.get('/TU', None)
-            if alternate_name is not None:
-                # If it's a PDF string object, get the text value
-                if hasattr(alternate_name, 'get_text'):
-                    alternate_name = alternate_name.get_text()
-                else:
-                    alternate_name = str(alternate_name)
-            
-            # Determine field type for better frontend display
-            field_type_display = "text"  # Default
-            if "/Btn" in field_type_str:
-                field_type_display = "checkbox" if field_obj.get('/Ff', 0) & (1 << 15) else "button"
-            elif "/Ch" in field_type_str:
-                field_type_display = "dropdown" if field_obj.get('/Ff', 0) & (1 << 17) else "list"
-            
-            # Add field to the response
-            field_data.append({
-                "name": field_name,
-                "alternate_name": alternate_name,
-                "type": field_type_display,
-                # Include parent name for nested fields if applicable
-                "parent": field_name.split('.')[0] if '.' in field_name else None
-            })
-        
-        # Sort fields to group related fields together
-        field_data.sort(key=lambda x: x["name"])
-        
-        return jsonify({
+    def catalog():
+        ensure_catalog(form)
+        fields = PdfFormField.query.filter_by(form_id=id).order_by(PdfFormField.name).all()
+        return {
             'form_id': id, 
             'form_name': form.form_name, 
-            'fields': field_data
-        }), 200
+            'fields': [field.to_dict() for field in fields]
+        }
+
+    try:
+        etag = make_etag('fields', form.id, form.uploaded_at, form.file_hash, form.page_count, form.form_name)
+        return cached_json(catalog, etag, form.uploaded_at)
 
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error reading PDF fields: {e}", exc_info=True)
         return jsonify({'error': f'Failed to read PDF fields: {str(e)}'}), 500
 
 # --- API Endpoints for Mappings ---
 @api.route('/mappings/form/<int:form_id>', methods=['GET'])
+@replica_reads
 def get_mappings_for_form(form_id):
-    """Gets all saved field mappings for a specific form."""
+    """Gets all saved field mappings for a specific form; 304 while mapping_version is unchanged."""
     # First verify the form exists
     form = db.session.get(PdfForm, form_id)
     if not form:
         return jsonify({'error': 'Form not found'}), 404
-        
-    mappings = FieldMapping.query.filter_by(form_id=form_id).all()
-    return jsonify([m.to_dict() for m in mappings]), 200
+
+    etag = make_etag('mappings', form.id, form.uploaded_at, form.mapping_version)
+    return cached_json(
+        lambda: [m.to_dict() for m in FieldMapping.query.filter_by(form_id=form_id).all()],
+        etag, form.updated_at or form.uploaded_at
+    )
+
+@api.route('/mappings/form/<int:form_id>/coverage', methods=['GET'])
+@replica_reads
+def get_mapping_coverage(form_id):
+    """
+    Dry run of a filing: per mapped field, how many entities would leave it blank,
+    and the ids of those entities, paged. Computed in the database (see coverage.py).
+    - required_only: only count PDF fields flagged Required as offending
+    - limit: offending entities per page (default 100, max 5000)
+    - after: the previous page's next_after
+    """
+    form = db.session.get(PdfForm, form_id)
+    if not form:
+        return jsonify({'error': 'Form not found'}), 404
+
+    required_only = request.args.get('required_only', 'false').lower() in ('1', 'true', 'yes')
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', COVERAGE_LIMIT, type=int), 1), COVERAGE_MAX_LIMIT)
+    # Changes with any entity write or mapping save
+    entities_etag, _ = _entities_etag()
+    etag = make_etag('coverage', form.id, form.uploaded_at, form.mapping_version, entities_etag)
+    return cached_json(lambda: mapping_coverage(form, required_only, after, limit), etag)
 
 @api.route('/mappings', methods=['POST'])
 def create_or_update_mappings():
@@ -225,30 +616,64 @@ def create_or_update_mappings():
         return jsonify({'error': 'Form not found'}), 404
     
     # Verify all entity fields being mapped are valid
-    entity_fields = ['name', 'street_address', 'city', 'state', 'zip_code']
-    
+    if not isinstance(new_mappings, dict):
+        return jsonify({'error': 'mappings must be an object of {pdf field: entity field}'}), 400
     for pdf_field, entity_field in new_mappings.items():
-        if entity_field and entity_field not in entity_fields:
+        if entity_field and entity_field not in ENTITY_FIELDS:
             return jsonify({
-                'error': f"Invalid entity field '{entity_field}'. Valid fields are: {', '.join(entity_fields)}"
+                'error': f"Invalid entity field '{entity_field}'. Valid fields are: {', '.join(ENTITY_FIELDS)}"
             }), 400
+
+    # The saved set replaces the current one; empty entity fields mean "unmapped"
+    desired = {pdf_field: entity_field for pdf_field, entity_field in new_mappings.items() if entity_field}
     
     try:
-        # Delete existing mappings for this form
-        FieldMapping.query.filter_by(form_id=form_id).delete()
-        
-        # Create new mappings
-        for pdf_field, entity_field in new_mappings.items():
-            if entity_field:  # Only create mapping if entity field is specified
-                mapping = FieldMapping(
-                    form_id=form_id,
-                    pdf_field_name=pdf_field,
-                    entity_field_name=entity_field
-                )
-                db.session.add(mapping)
-                
+        # Lock the form row so concurrent saves of one form apply one after the other
+        db.session.execute(db.select(PdfForm.id).where(PdfForm.id == form_id).with_for_update())
+        existing = {
+            row.pdf_field_name: row
+            for row in db.session.execute(
+                db.select(FieldMapping.id, FieldMapping.pdf_field_name, FieldMapping.entity_field_name)
+                .where(FieldMapping.form_id == form_id)
+            )
+        }
+
+        # Diff against what is stored and apply each part as one bulk statement
+        to_remove = [row.id for name, row in existing.items() if name not in desired]
+        to_change = [
+            {'id': existing[name].id, 'entity_field_name': entity_field}
+            for name, entity_field in desired.items()
+            if name in existing and existing[name].entity_field_name != entity_field
+        ]
+        to_add = [
+            {'form_id': form_id, 'pdf_field_name': name, 'entity_field_name': entity_field}
+            for name, entity_field in desired.items() if name not in existing
+        ]
+        if to_remove:
+            db.session.execute(db.delete(FieldMapping).where(FieldMapping.id.in_(to_remove)))
+        if to_change:
+            db.session.execute(db.update(FieldMapping), to_change)
+        if to_add:
+            db.session.execute(db.insert(FieldMapping), to_add)
+
+        changed = bool(to_remove or to_change or to_add)
+        if changed:
+            # Downstream caches (fill plans, generated output) key on this
+            form.mapping_version = PdfForm.mapping_version + 1
+            mark_form_changed(form_id, 'mappings')
         db.session.commit()
-        return jsonify({'message': 'Mappings saved successfully'}), 201
+        if changed:
+            fill_plans.invalidate(form_id)
+            output_cache.invalidate_form(form_id)
+        logger.info(f"Saved mappings for form ID {form_id}: {len(to_add)} added, "
+                    f"{len(to_change)} changed, {len(to_remove)} removed")
+        return jsonify({
+            'message': 'Mappings saved successfully',
+            'added': len(to_add),
+            'changed': len(to_change),
+            'removed': len(to_remove),
+            'mapping_version': form.mapping_version
+        }), 201
         
     except Exception as e:
         db.session.rollback()
@@ -256,13 +681,23 @@ def create_or_update_mappings():
         return jsonify({'error': f'Failed to save mappings: {str(e)}'}), 500
 
 # --- Enhanced PDF Generation Endpoint ---
-@api.route('/generate-pdf', methods=['POST'])
+@api.route('/generate-pdf', methods=['GET', 'POST'])
 def generate_pdf():
     """
     Generates a filled PDF for a specific entity and form.
     Enhanced with better error handling, logging, and field population.
+    POST takes a JSON body; GET takes entity_id, form_id and output_mode as query parameters.
+    Responses carry a strong ETag, and a matching If-None-Match is answered with 304.
     """
-    data = request.json
+    if request.method == 'GET':
+        data = {
+            'entity_id': request.args.get('entity_id', type=int),
+            'form_id': request.args.get('form_id', type=int),
+            'output_mode': request.args.get('output_mode')
+        }
+        data = {key: value for key, value in data.items() if value is not None}
+    else:
+        data = request.json
     if not data or 'entity_id' not in data or 'form_id' not in data:
         return jsonify({'error': 'Invalid data. Required: entity_id, form_id'}), 400
         
@@ -279,88 +714,258 @@ def generate_pdf():
     if not form:
         return jsonify({'error': 'Form not found'}), 404
 
-    # Get the Mappings
-    mappings = FieldMapping.query.filter_by(form_id=form_id).all()
-    if not mappings:
-        return jsonify({'error': 'No mappings found for this form. Please configure field mappings first.'}), 400
+    # "output_mode" in the request overrides the form's default
+    try:
+        output_mode = resolve_output_mode(data.get('output_mode'), form.output_mode)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The ETag is derived from the inputs, so a revalidation needs no filling at all
+    etag = output_key(entity, form, output_mode)
+    if request.if_none_match.contains_weak(etag):
+        not_modified = Response(status=304)
+        not_modified.set_etag(etag)
+        return not_modified
 
     try:
-        # Load the template PDF
-        pdf_file_stream = io.BytesIO(form.file_data)
-        reader = PdfReader(pdf_file_stream)
-        
-        # Verify the PDF has form fields
-        fields = reader.get_fields()
-        if not fields:
-            return jsonify({'error': 'The PDF does not contain any fillable form fields'}), 400
-        
-        writer = PdfWriter()
-        
-        # Clone the entire document from the reader, including form fields
-        writer.clone_document_from_reader(reader)
-        writer.set_need_appearances_writer(True)
+        pdf_bytes = output_cache.get(etag, form.id, entity.id)
+        if pdf_bytes is None:
+            # Get the compiled fill plan: the mappings, grouped by the pages holding their widgets
+            with metrics.stage('plan'):
+                plan = fill_plans.get(form)
+            if not plan.mappings:
+                return jsonify({'error': 'No mappings found for this form. Please configure field mappings first.'}), 400
 
-        # Prepare the field data dictionary
-        fill_data = {}
-        
-        # Track field mappings for logging
-        mapped_fields = []
-        
-        # Loop through mappings and build the fill data dictionary
-        for mapping in mappings:
-            pdf_field = mapping.pdf_field_name
-            entity_field = mapping.entity_field_name
+            # Verify the PDF has form fields
+            if not plan.has_fields:
+                return jsonify({'error': 'The PDF does not contain any fillable form fields'}), 400
+
+            # Load the template; it is only parsed here if filling runs inline
+            template = load_template(form)
             
-            # Get the value from the entity object
-            value = entity.get_field(entity_field)
+            # Prepare the field data dictionary
+            fill_data = plan.fill_data(entity)
+            logger.info(f"Applying {len(fill_data)} of {len(plan.mappings)} mappings to form ID {form_id} on {len(plan.pages)} pages")
             
-            if value is not None:
-                # Convert value to string
-                string_value = str(value)
-                
-                # Add to fill data
-                fill_data[pdf_field] = string_value
-                mapped_fields.append(f"{pdf_field} -> {entity_field} = '{string_value}'")
-            else:
-                logger.warning(f"No value found for entity field '{entity_field}' (mapped to PDF field '{pdf_field}')")
-        
-        # Log the mappings that will be applied
-        logger.info(f"Applying {len(mapped_fields)} mappings to PDF: {mapped_fields}")
-        
-        # Apply the field values - PyPDF library will handle this
-        if fill_data:
-            # The writer now has the AcroForm, so this will work
-            writer.update_page_form_field_values(writer.pages[0], fill_data)
-            
-            # For multi-page forms, try to apply to all pages
-            for i in range(1, len(writer.pages)):
-                try:
-                    writer.update_page_form_field_values(writer.pages[i], fill_data)
-                except Exception as page_error:
-                    logger.warning(f"Could not fill fields on page {i+1}: {page_error}")
-        
-        # Save the filled PDF to a new in-memory stream
-        output_stream = io.BytesIO()
-        writer.write(output_stream)
-        output_stream.seek(0)
+            # Fill only the planned pages, in the fill pool
+            pdf_bytes = fill_pool.fill_one(template, fill_data, pages=plan.pages, mode=output_mode)
+            output_cache.put(etag, form.id, entity.id, pdf_bytes)
+        else:
+            logger.debug(f"Serving cached PDF for entity ID {entity_id}, form ID {form_id}")
         
         # Create a meaningful filename
-        filename = f"{entity.name.replace(' ', '_')}_{form.form_name.replace(' ', '_')}.pdf"
+        filename = output_filename(entity.name, form.form_name)
         
         # Send the PDF as a response
         return send_file(
-            output_stream,
+            io.BytesIO(pdf_bytes),
             download_name=filename,
             mimetype='application/pdf',
-            as_attachment=True
+            as_attachment=True,
+            etag=etag
         )
 
+    except (PoolSaturated, FillTimeout):
+        raise
     except Exception as e:
         logger.error(f"Error generating PDF: {e}", exc_info=True)
         return jsonify({'error': f'Failed to generate PDF: {str(e)}'}), 500
     
+@api.route('/generate-pdf/bulk', methods=['POST'])
+def generate_pdf_bulk():
+    """
+    Generates filled PDFs of one form for many entities, streamed back as a ZIP.
+    Entities are picked by "entity_ids" and/or an exact-match "filter" like {"state": "CA"}.
+    Filling is spread over the fill pool; failures are listed in errors.json inside the archive.
+    """
+    data = request.json
+    if not data or 'form_id' not in data or ('entity_ids' not in data and 'filter' not in data):
+        return jsonify({'error': 'Invalid data. Required: form_id and entity_ids or filter'}), 400
+
+    form_id = data.get('form_id')
+    entity_ids = data.get('entity_ids')
+
+    # Don't start a stream the pool can't serve
+    if fill_pool.saturated('batch'):
+        raise PoolSaturated('PDF generation is at capacity', fill_pool.retry_after)
+
+    # Get the PDF Form
+    form = db.session.get(PdfForm, form_id)
+    if not form:
+        return jsonify({'error': 'Form not found'}), 404
+
+    # Get all requested entities in one query
+    try:
+        output_mode = resolve_output_mode(data.get('output_mode'), form.output_mode)
+        entities = Entity.matching(entity_ids, data.get('filter')).all()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not entities:
+        return jsonify({'error': 'No matching entities found'}), 404
+
+    try:
+        plan = fill_plans.get(form)
+        if not plan.mappings:
+            return jsonify({'error': 'No mappings found for this form. Please configure field mappings first.'}), 400
+        if not plan.has_fields:
+            return jsonify({'error': 'The PDF does not contain any fillable form fields'}), 400
+        template = load_template(form)
+    except Exception as e:
+        logger.error(f"Error loading template for bulk generation: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to generate PDFs: {str(e)}'}), 500
+
+    # Fill data is built up front so the stream never needs the database session
+    items = [
+        (f"{entity.id}_{output_filename(entity.name, form.form_name)}", plan.fill_data(entity))
+        for entity in entities
+    ]
+    found_ids = {entity.id for entity in entities}
+    errors = [
+        {'entity_id': entity_id, 'error': 'Entity not found'}
+        for entity_id in (entity_ids or []) if entity_id not in found_ids
+    ]
+    logger.info(f"Bulk generating {len(items)} PDFs for form ID {form_id}")
+
+    def files():
+        for filename, pdf_bytes, error in fill_pool.fill_many(template, items, pages=plan.pages, mode=output_mode):
+            if error:
+                errors.append({'file': filename, 'error': error})
+                continue
+            yield filename, pdf_bytes
+        if errors:
+            yield 'errors.json', json.dumps(errors, indent=2).encode('utf-8')
+
+    archive_name = f"{form.form_name.replace(' ', '_')}_bulk.zip"
+    return Response(
+        stream_zip(files()),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{archive_name}"'}
+    )
+    
+@api.route('/generate-pdf/packet', methods=['POST'])
+def generate_pdf_packet():
+    """
+    Fills several forms for one entity and streams them back merged into one PDF.
+    Body: {"entity_id": 1, "form_ids": [3, 1, 7]}; forms appear in the given order,
+    with each form's fields namespaced as "form<id>.<field>".
+    """
+    data = request.json
+    if not data or 'entity_id' not in data or not isinstance(data.get('form_ids'), list) or not data['form_ids']:
+        return jsonify({'error': 'Invalid data. Required: entity_id, form_ids (a non-empty list)'}), 400
+    form_ids = data['form_ids']
+    if len(form_ids) > MAX_PACKET_FORMS:
+        return jsonify({'error': f'A packet can hold at most {MAX_PACKET_FORMS} forms'}), 400
+    if not _is_id(data['entity_id']) or not all(_is_id(form_id) for form_id in form_ids):
+        return jsonify({'error': 'entity_id and form_ids must be integers'}), 400
+
+    entity = db.session.get(Entity, data['entity_id'])
+    if not entity:
+        return jsonify({'error': 'Entity not found'}), 404
+
+    # All forms in one query, then their plans with one query for any uncached mappings
+    forms = {form.id: form for form in PdfForm.query.filter(PdfForm.id.in_(form_ids))}
+    missing = [form_id for form_id in form_ids if form_id not in forms]
+    if missing:
+        return jsonify({'error': f'Forms not found: {missing}'}), 404
+    ordered_forms = [forms[form_id] for form_id in form_ids]
+
+    try:
+        plans = fill_plans.get_many(ordered_forms)
+        unmapped = [form.id for form, plan in zip(ordered_forms, plans) if not plan.mappings]
+        if unmapped:
+            return jsonify({'error': f'No mappings found for forms: {unmapped}. Please configure field mappings first.'}), 400
+        fieldless = [form.id for form, plan in zip(ordered_forms, plans) if not plan.has_fields]
+        if fieldless:
+            return jsonify({'error': f'Forms without fillable form fields: {fieldless}'}), 400
+
+        # Reuse single-form outputs where cached; fill the rest in parallel
+        parts = [None] * len(ordered_forms)
+        to_fill = []
+        for i, (form, plan) in enumerate(zip(ordered_forms, plans)):
+            key = output_key(entity, form, 'full')
+            parts[i] = output_cache.get(key, form.id, entity.id)
+            if parts[i] is None:
+                to_fill.append((i, key, form, plan))
+        results = fill_pool.fill_each([
+            (load_template(form), output_filename(entity.name, form.form_name), plan.fill_data(entity), plan.pages, 'full')
+            for _, _, form, plan in to_fill
+        ])
+        for (i, key, form, _), (filename, pdf_bytes, error) in zip(to_fill, results):
+            if error:
+                return jsonify({'error': f'Failed to fill form ID {form.id}: {error}'}), 500
+            output_cache.put(key, form.id, entity.id, pdf_bytes)
+            parts[i] = pdf_bytes
+
+        # The same form twice gets a numbered namespace the second time
+        namespaces = []
+        for i, form_id in enumerate(form_ids):
+            repeat = form_ids[:i].count(form_id)
+            namespaces.append(f"form{form_id}_{repeat + 1}" if repeat else f"form{form_id}")
+        with metrics.stage('merge'):
+            writer = merge_packet(list(zip(namespaces, parts)))
+        logger.info(f"Packet for entity ID {entity.id}: {len(ordered_forms)} forms, {len(to_fill)} filled")
+    except (PoolSaturated, FillTimeout):
+        raise
+    except Exception as e:
+        logger.error(f"Error generating packet: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to generate packet: {str(e)}'}), 500
+
+    filename = f"{entity.name.replace(' ', '_')}_packet.pdf"
+    return Response(
+        stream_pdf(writer),
+        mimetype='application/pdf',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+# --- Stale generated documents ---
+@api.route('/documents/stale', methods=['GET'])
+@replica_reads
+def get_stale_documents():
+    """
+    Lists stored documents whose entity fields or form mappings changed since
+    they were generated: {"documents": [...], "next_after": <id or null>}.
+    Optional filters: form_id, entity_id; paging: limit (default 50, max 500), after.
+    """
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    # One extra row tells whether there is a next page
+    documents = stale_documents(
+        form_id=request.args.get('form_id', type=int),
+        entity_id=request.args.get('entity_id', type=int),
+        after=request.args.get('after', 0, type=int),
+        limit=limit + 1
+    )
+    next_after = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_after = documents[-1].id
+    return jsonify({
+        'documents': [document.to_dict() for document in documents],
+        'next_after': next_after
+    }), 200
+
+@api.route('/documents/stale/regenerate', methods=['POST'])
+def regenerate_stale_documents():
+    """
+    Queues one generation job per form for just its stale documents.
+    Body (optional): {"form_id": N} to limit it to one form. The documents turn
+    fresh again as the jobs store their output.
+    """
+    form_id = (request.get_json(silent=True) or {}).get('form_id')
+    try:
+        jobs = []
+        for stale_form_id, entity_ids in stale_pairs(form_id).items():
+            jobs.append(queue_job(stale_form_id, entity_ids))
+        db.session.commit()
+        logger.info(f"Queued {len(jobs)} regeneration jobs for {sum(job.total for job in jobs)} stale documents")
+        return jsonify({'jobs': [job.to_dict() for job in jobs]}), 202
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error queuing regeneration: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to queue regeneration: {str(e)}'}), 500
+
 # --- Debugging endpoints for troubleshooting ---
 @api.route('/debug/form/<int:id>', methods=['GET'])
+@replica_reads
 def debug_form_fields(id):
     """
     Debug endpoint to get detailed information about a form's fields.
@@ -371,30 +976,17 @@ def debug_form_fields(id):
         return jsonify({'error': 'Form not found'}), 404
 
     try:
-        pdf_file = io.BytesIO(form.file_data)
-        reader = PdfReader(pdf_file)
-        
-        # Get all form fields
-        fields = reader.get_fields()
+        ensure_catalog(form)
+        fields = PdfFormField.query.filter_by(form_id=id).order_by(PdfFormField.name).all()
         
-        # Prepare detailed field info
-        field_details = {}
-        for field_name, field_obj in fields.items():
-            # Extract all field properties
-            properties = {}
-            for key, value in field_obj.items():
-                if hasattr(value, 'get_text'):
-                    properties[str(key)] = value.get_text()
-                else:
-                    properties[str(key)] = str(value)
-                    
-            field_details[field_name] = properties
+        # Detailed field info, stored at upload time
+        field_details = {field.name: field.properties for field in fields}
         
         # Return detailed field information
         return jsonify({
             'form_id': id,
             'form_name': form.form_name,
-            'page_count': len(reader.pages),
+            'page_count': form.page_count,
             'field_count': len(fields),
             'fields': field_details
         }), 200
@@ -403,7 +995,29 @@ def debug_form_fields(id):
         logger.error(f"Debug error: {e}", exc_info=True)
         return jsonify({'error': f'Debug error: {str(e)}'}), 500
 
+@api.route('/debug/template-cache', methods=['GET'])
+def debug_template_cache():
+    """
+    Debug endpoint reporting template cache usage, for sizing TEMPLATE_CACHE_MAX_BYTES.
+    """
+    return jsonify(template_cache.stats()), 200
+
+@api.route('/debug/output-cache', methods=['GET'])
+def debug_output_cache():
+    """
+    Debug endpoint reporting generated-PDF cache usage, for sizing OUTPUT_CACHE_MAX_BYTES.
+    """
+    return jsonify(output_cache.stats()), 200
+
+@api.route('/debug/fill-pool', methods=['GET'])
+def debug_fill_pool():
+    """
+    Debug endpoint reporting fill pool slot usage, for sizing FILL_POOL_WORKERS and FILL_QUEUE_SIZE.
+    """
+    return jsonify(fill_pool.stats()), 200
+
 @api.route('/debug/test-mapping', methods=['POST'])
+@replica_reads
 def debug_test_mapping():
     """
     Debug endpoint to test field mappings without generating a PDF.
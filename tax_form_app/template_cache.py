@@ -0,0 +1,153 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+from .metrics import metrics
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+# Default cache budget: 256 MB of template bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ParsedTemplate:
+    """
+    A template's raw bytes and, parsed on first use, its reader and field tree.
+    Fills in the pool only need the bytes, so the request process parses a
+    template only when it fills inline or reads the field tree.
+    PdfReader reads lazily from its stream, so callers must hold `lock`
+    while touching `reader` or `fields`.
+    """
+
+    def __init__(self, form_id, content_hash, file_data, reader=None):
+        self.form_id = form_id
+        self.content_hash = content_hash
+        self.file_data = file_data
+        self._reader = reader
+        self._fields = None
+        # Re-entrant, as parsing on first access happens under it too
+        self.lock = threading.RLock()
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            with self.lock:
+                if self._reader is None:
+                    # BytesIO shares the bytes buffer until written to, so this is zero-copy
+                    from pypdf import PdfReader
+                    with metrics.stage('template_parse'):
+                        self._reader = PdfReader(io.BytesIO(self.file_data))
+        return self._reader
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            with self.lock:
+                if self._fields is None:
+                    self._fields = self.reader.get_fields() or {}
+        return self._fields
+
+    @property
+    def size(self):
+        """Approximate memory cost, measured by the template size."""
+        return len(self.file_data)
+
+
+class TemplateCache:
+    """
+    Thread-safe LRU cache of templates, bounded by total template bytes.
+    Entries are keyed by (form id, content hash) so a re-uploaded template
+    never serves a stale parse.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_bytes):
+        """Changes the byte budget, evicting entries if it shrank."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, form_id, content_hash, loader):
+        """
+        Returns the cached template for a form.
+        On a miss, `loader()` is called to fetch the template bytes.
+        """
+        key = (form_id, content_hash)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Load outside the lock so other templates are not blocked
+        entry = ParsedTemplate(form_id, content_hash, loader())
+        return self._store(key, entry)
+
+    def put(self, form_id, content_hash, file_data, reader=None):
+        """Adds an already-parsed template (e.g. right after upload)."""
+        entry = ParsedTemplate(form_id, content_hash, file_data, reader=reader)
+        return self._store((form_id, content_hash), entry)
+
+    def invalidate(self, form_id):
+        """Drops every cached entry for a form."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == form_id]:
+                self._current_bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        """Drops all cached entries and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and current usage."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'current_bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def _store(self, key, entry):
+        if entry.size > self.max_bytes:
+            logger.info(f"Template for form {key[0]} ({entry.size} bytes) exceeds cache budget, not cached")
+            return entry
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                # Another thread loaded the same template first
+                self._entries.move_to_end(key)
+                return existing
+            self._entries[key] = entry
+            self._current_bytes += entry.size
+            self._evict()
+        return entry
+
+    def _evict(self):
+        while self._current_bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._current_bytes -= entry.size
+            self.evictions += 1
+            logger.debug(f"Evicted template for form {key[0]} from cache")
+
+
+# Shared, process-wide cache instance (configured in create_app)
+template_cache = TemplateCache()
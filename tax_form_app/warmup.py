@@ -0,0 +1,101 @@
+"""
+Warm start for pre-fork servers.
+
+Before the server forks its workers, loads the most-used templates into the
+template cache along with their field catalogs and compiled fill plans.
+Forked workers then share those pages copy-on-write instead of each paying
+the blob fetch on its first request.
+
+Fill pool processes are spawned, not forked, so they can't share that heap.
+The templates are handed to the pool instead (FillPool.preload), and every
+pool process parses them as it starts. Only with FILL_POOL_WORKERS=0, where
+requests fill inline, are the templates parsed here. Enable with
+WARM_START_FORMS and preload the app, and start the pools right after the
+fork so they are warm before traffic arrives:
+
+    # gunicorn.conf.py
+    def post_fork(server, worker):
+        from tax_form_app.fill_pool import fill_pool
+        fill_pool.start()
+
+    WARM_START_FORMS=20 WEB_CONCURRENCY=4 gunicorn --preload -c gunicorn.conf.py tax_form_app.app:app
+
+Every server worker runs its own fill pool: with WEB_CONCURRENCY set, the
+default FILL_POOL_WORKERS gives each a share of the cores rather than all of them.
+"""
+import gc
+import time
+import logging
+from .models import db, PdfForm, PdfBlob, FieldMapping, GenerationJob
+from .template_cache import template_cache
+from .blob_store import load_template, ensure_catalog
+from .fill_plan import fill_plans
+from .filling import fill_reader
+from .fill_pool import fill_pool
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+
+def most_used_forms(limit):
+    """Mapped forms, most background-generation jobs first, then the newest."""
+    job_counts = (
+        db.select(GenerationJob.form_id, db.func.count().label('jobs'))
+        .group_by(GenerationJob.form_id)
+        .subquery()
+    )
+    return (
+        PdfForm.query
+        .outerjoin(job_counts, job_counts.c.form_id == PdfForm.id)
+        .filter(db.exists().where(FieldMapping.form_id == PdfForm.id))
+        .order_by(db.func.coalesce(job_counts.c.jobs, 0).desc(), PdfForm.uploaded_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def warm_start(app, limit):
+    """
+    Preloads up to `limit` templates, within the template cache budget, then
+    drops the database connections and freezes the heap so it can be shared
+    by forked workers. Returns the number of forms warmed.
+    """
+    started = time.perf_counter()
+    warmed = []
+    with app.app_context():
+        forms = most_used_forms(limit)
+        sizes = dict(db.session.execute(
+            db.select(PdfBlob.sha256, PdfBlob.size).where(PdfBlob.sha256.in_({form.file_hash for form in forms}))
+        ).all())
+        budget = template_cache.max_bytes
+        for form in forms:
+            size = sizes.get(form.file_hash, 0)
+            # Stay inside the cache budget, so warming never evicts what it just loaded
+            if size > budget:
+                continue
+            try:
+                template = load_template(form)
+                ensure_catalog(form)
+                if fill_pool.workers > 0:
+                    fill_pool.preload(template)
+                else:
+                    # A throwaway fill resolves every object the real fills will read
+                    fill_reader(template.reader, {}, lock=template.lock)
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Could not warm form ID {form.id}: {e}")
+                continue
+            budget -= size
+            warmed.append(form)
+        # All the mappings in one query
+        fill_plans.get_many(warmed)
+        db.session.remove()
+        # Connections must not be shared across the fork
+        for engine in db.engines.values():
+            engine.dispose()
+
+    # Keep the collector from touching (and so copying) the preloaded objects in every worker
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Warm start: {len(warmed)} of {len(forms)} forms preloaded in {time.perf_counter() - started:.2f}s")
+    return len(warmed)
@@ -0,0 +1,199 @@
+"""
+Background worker for generation jobs.
+
+Workers claim queued jobs straight from the database, fill the PDFs through
+the fill pool and store each result on its generation_job_items row, so only
+the app's own Postgres or SQLite is needed. Run any number alongside the app:
+
+    python -m tax_form_app.worker
+
+or set JOB_WORKER_THREADS to run workers inside the app process.
+"""
+import os
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from .models import db, Entity, GenerationJob, GenerationJobItem
+from .blob_store import load_template
+from .filling import output_filename, resolve_output_mode
+from .fill_plan import fill_plans
+from .fill_pool import fill_pool
+from .documents import record_generated
+
+# Get the logger
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_POLL_SECONDS = 2
+DEFAULT_STALE_SECONDS = 300
+
+
+def _claimable(stale_before):
+    """Jobs that are queued, or running under a worker that stopped sending heartbeats."""
+    return db.or_(
+        GenerationJob.status == 'queued',
+        db.and_(GenerationJob.status == 'running', GenerationJob.heartbeat_at < stale_before)
+    )
+
+
+def claim_job(worker_id, stale_seconds=DEFAULT_STALE_SECONDS):
+    """
+    Atomically claims the oldest claimable job for this worker.
+    The conditional UPDATE makes sure only one worker wins each job.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=stale_seconds)
+    candidates = db.session.execute(
+        db.select(GenerationJob.id).where(_claimable(stale_before)).order_by(GenerationJob.id).limit(5)
+    ).scalars().all()
+
+    for job_id in candidates:
+        now = datetime.utcnow()
+        result = db.session.execute(
+            db.update(GenerationJob)
+            .where(GenerationJob.id == job_id, _claimable(stale_before))
+            .values(
+                status='running',
+                worker=worker_id,
+                started_at=db.func.coalesce(GenerationJob.started_at, now),
+                heartbeat_at=now
+            )
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return db.session.get(GenerationJob, job_id)
+    return None
+
+
+def process_job(job, batch_size=DEFAULT_BATCH_SIZE):
+    """Fills every pending item of a claimed job, committing progress after each batch while it holds the claim."""
+    logger.info(f"Processing job ID {job.id}: {job.total} entities for form ID {job.form_id}")
+    # Every write below is conditional on still holding the claim: a worker that stalled past
+    # JOB_STALE_SECONDS may have lost the job to another one and must not write over its results
+    owner = GenerationJob.worker == job.worker
+    try:
+        form = job.form
+        plan = fill_plans.get(form)
+        if not plan.mappings:
+            raise ValueError('No mappings found for this form')
+        template = load_template(form)
+        output_mode = resolve_output_mode(job.output_mode, form.output_mode)
+
+        while True:
+            items = GenerationJobItem.query.filter_by(job_id=job.id, status='pending') \
+                .order_by(GenerationJobItem.id).limit(batch_size).all()
+            if not items:
+                break
+
+            entities = {
+                entity.id: entity
+                for entity in Entity.query.filter(Entity.id.in_([item.entity_id for item in items]))
+            }
+            done = failed = 0
+            to_fill = []
+            for item in items:
+                entity = entities.get(item.entity_id)
+                if entity is None:
+                    item.status = 'failed'
+                    item.error = 'Entity not found'
+                    failed += 1
+                    continue
+                item.filename = f"{entity.id}_{output_filename(entity.name, form.form_name)}"
+                to_fill.append((item, entity, plan.fill_data(entity)))
+
+            results = fill_pool.fill_many(
+                template, [(item.filename, fill_data) for item, _, fill_data in to_fill],
+                pages=plan.pages, mode=output_mode
+            )
+            generated = []
+            for (item, entity, _), (filename, pdf_bytes, error) in zip(to_fill, results):
+                if error:
+                    item.status = 'failed'
+                    item.error = error
+                    failed += 1
+                else:
+                    item.status = 'done'
+                    item.output = pdf_bytes
+                    generated.append((entity, item.id))
+                    done += 1
+            record_generated(form.id, plan.version, output_mode, generated)
+
+            # Only the counters and heartbeat are written, so a concurrent cancel is not overwritten.
+            # The row lock this takes also holds off a reclaim until the batch is committed.
+            result = db.session.execute(
+                db.update(GenerationJob)
+                .where(GenerationJob.id == job.id, owner)
+                .values(
+                    completed=GenerationJob.completed + done,
+                    failed=GenerationJob.failed + failed,
+                    heartbeat_at=datetime.utcnow()
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                db.session.rollback()
+                logger.warning(f"Job ID {job.id} was reclaimed by another worker; dropping this batch")
+                return
+            db.session.commit()
+
+            if job.status == 'cancelled':
+                logger.info(f"Job ID {job.id} cancelled")
+                return
+
+        # Conditional, so a cancel that landed after the last batch is kept
+        db.session.execute(
+            db.update(GenerationJob)
+            .where(GenerationJob.id == job.id, GenerationJob.status == 'running', owner)
+            .values(status='completed', finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+        logger.info(f"Job ID {job.id} completed: {job.completed} done, {job.failed} failed")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Job ID {job.id} failed: {e}", exc_info=True)
+        db.session.execute(
+            db.update(GenerationJob)
+            .where(GenerationJob.id == job.id, owner)
+            .values(status='failed', error=str(e), finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+
+def run_worker(app, stop_event=None):
+    """Claims and processes jobs until `stop_event` is set."""
+    stop_event = stop_event or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    logger.info(f"Generation worker {worker_id} started")
+
+    with app.app_context():
+        while not stop_event.is_set():
+            try:
+                job = claim_job(worker_id, app.config.get('JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS))
+                if job is None:
+                    stop_event.wait(app.config.get('JOB_POLL_SECONDS', DEFAULT_POLL_SECONDS))
+                    continue
+                process_job(job, app.config.get('JOB_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Generation worker error: {e}", exc_info=True)
+                stop_event.wait(app.config.get('JOB_POLL_SECONDS', DEFAULT_POLL_SECONDS))
+            finally:
+                db.session.remove()
+
+
+def start_worker_threads(app, count):
+    """Runs `count` workers as daemon threads inside the app process."""
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(target=run_worker, args=(app,), name=f"generation-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+# -main-
+if __name__ == '__main__':
+    from . import create_app
+    run_worker(create_app())
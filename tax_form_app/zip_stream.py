@@ -0,0 +1,38 @@
+import io
+import zipfile
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files):
+    """
+    Streams a ZIP archive built from an iterable of (filename, bytes).
+    Each file is yielded as soon as it is added, so only one member is in memory at a time.
+    PDFs are already compressed, so members are stored rather than deflated.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, data in files:
+            archive.writestr(filename, data)
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    # Central directory
+    yield buffer.drain()